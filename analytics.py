@@ -0,0 +1,222 @@
+# analytics.py
+# ------------
+# Statistics over many recorded games, without a display.
+
+"""
+Plays recorded games again without a display, in a pool of worker processes,
+and writes statistics about them as tables of comma separated values:
+
+  games.csv   a row per game: layout, score, winner, moves, the food eaten
+              and capsules used by each team, and for every agent its deaths
+              and the fraction of its moves spent as a pacman (on the other
+              side)
+  curves.csv  the food eaten by each team in every game, every interval moves
+  layouts.csv a row per layout: games played and the win rates of each colour
+
+Recordings can be in the replay format of replay.py or older pickles (from
+capture.py --record or unpack.py). Directories are searched for both. The
+layouts of old pickles have no name, so they are named after the layout of
+layouts/ with the same text.
+
+USAGE: python analytics.py -o stats -w 4 recordings/ recorded-game-1
+"""
+
+import os
+import sys
+import csv
+import glob
+import hashlib
+import itertools
+import collections
+
+import replay
+
+def findRecordings(paths):
+  "The recordings in paths, which may be files or directories"
+  for path in paths:
+    if os.path.isdir(path):
+      for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if os.path.isfile(full) and (name.startswith('recorded-game-') or
+            name.startswith('replay_') or replay.isReplay(full)):
+          yield full
+    else:
+      yield path
+
+_layoutNames = None
+
+def getLayoutName(layout, directory='layouts'):
+  """
+  The name of layout, or that of the layout in directory with the same text,
+  so that the recordings of a layout are grouped together whether or not they
+  kept its name. A layout that is not in directory is named after a digest of
+  its text.
+  """
+  global _layoutNames
+  name = getattr(layout, 'name', None)
+  if name:
+    return name
+  if _layoutNames is None:
+    _layoutNames = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.lay'))):
+      f = open(path)
+      try:
+        text = tuple(line.strip() for line in f)
+      finally:
+        f.close()
+      _layoutNames.setdefault(text, os.path.basename(path)[:-len('.lay')])
+  text = tuple(layout.layoutText)
+  if text in _layoutNames:
+    return _layoutNames[text]
+  return 'unknown-' + hashlib.md5('\n'.join(text)).hexdigest()[:8]
+
+def analyzeGame(recorded, interval=100):
+  """
+  Statistics of a recorded game (as loaded by replay.loadReplay): a dict of
+  the columns of games.csv and the food curve as (move, red, blue) rows
+  """
+  import capture
+  layout, actions = recorded['layout'], recorded['actions']
+  numAgents = len(recorded['agents'])
+  state = capture.GameState()
+  state.initialize(layout, numAgents)
+  redFood, blueFood = state.getRedFood().count(), state.getBlueFood().count()
+  starts = [s.start for s in state.data.agentStates]
+
+  deaths = [0] * numAgents
+  moves = [0] * numAgents
+  offense = [0] * numAgents
+  capsules = [0, 0]
+  curve = [(0, 0, 0)]
+  for k, (agentIndex, action) in enumerate(actions):
+    before = [s.configuration for s in state.data.agentStates]
+    state = state.generateSuccessor(agentIndex, action)
+    agentStates = state.data.agentStates
+
+    # An agent that is caught goes back to its start
+    for i, agentState in enumerate(agentStates):
+      if agentState.configuration is starts[i] and before[i] is not starts[i]:
+        deaths[i] += 1
+    if state.data._capsuleEaten is not None:
+      capsules[agentIndex % 2] += 1
+    moves[agentIndex] += 1
+    if agentStates[agentIndex].isPacman:
+      offense[agentIndex] += 1
+    if (k + 1) % interval == 0 or k + 1 == len(actions):
+      curve.append((k + 1, blueFood - state.getBlueFood().count(),
+                    redFood - state.getRedFood().count()))
+
+  score = state.data.score
+  row = collections.OrderedDict([
+    ('layout', getLayoutName(layout)),
+    ('score', score),
+    ('winner', 'Red' if score > 0 else 'Blue' if score < 0 else 'Tie'),
+    ('moves', len(actions)),
+    ('redFoodEaten', curve[-1][1]),
+    ('blueFoodEaten', curve[-1][2]),
+    ('redCapsules', capsules[0]),
+    ('blueCapsules', capsules[1])])
+  for i in range(numAgents):
+    row['deaths%d' % i] = deaths[i]
+  for i in range(numAgents):
+    row['offense%d' % i] = round(float(offense[i]) / max(1, moves[i]), 3)
+  return row, curve
+
+def analyzeFile(task):
+  "Loads and analyzes a recording. Returns (path, row, curve, error)"
+  path, interval = task
+  try:
+    row, curve = analyzeGame(replay.loadReplay(path), interval)
+    return path, row, curve, None
+  except Exception, e:
+    return path, None, None, '%s: %s' % (type(e).__name__, e)
+
+class Tables:
+  """
+  The output tables, written a row at a time as the games are analyzed. The
+  columns of games.csv are those of the first game (the others must have as
+  many agents).
+  """
+  def __init__(self, directory):
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self.directory = directory
+    self.gamesFile = open(os.path.join(directory, 'games.csv'), 'wb')
+    self.curvesFile = open(os.path.join(directory, 'curves.csv'), 'wb')
+    self.games = None
+    self.curves = csv.writer(self.curvesFile)
+    self.curves.writerow(['game', 'move', 'redFoodEaten', 'blueFoodEaten'])
+    self.layouts = collections.defaultdict(lambda: [0, 0, 0])
+
+  def add(self, path, row, curve):
+    if self.games is None:
+      self.games = csv.writer(self.gamesFile)
+      self.games.writerow(['game'] + row.keys())
+    self.games.writerow([path] + row.values())
+    for point in curve:
+      self.curves.writerow((path,) + point)
+    self.layouts[row['layout']][['Red', 'Tie', 'Blue'].index(row['winner'])] += 1
+
+  def close(self):
+    self.gamesFile.close()
+    self.curvesFile.close()
+    out = open(os.path.join(self.directory, 'layouts.csv'), 'wb')
+    layouts = csv.writer(out)
+    layouts.writerow(['layout', 'games', 'redWinRate', 'tieRate', 'blueWinRate'])
+    for name, counts in sorted(self.layouts.items()):
+      total = float(sum(counts))
+      layouts.writerow([name, int(total)] + [round(c / total, 3) for c in counts])
+    out.close()
+
+def runAnalytics(paths, directory, numWorkers=1, interval=100):
+  "Analyzes the recordings in paths and writes the tables to directory"
+  tasks = ((path, interval) for path in findRecordings(paths))
+  pool = None
+  if numWorkers > 1:
+    import multiprocessing
+    pool = multiprocessing.Pool(numWorkers)
+    results = pool.imap_unordered(analyzeFile, tasks, 4)
+  else:
+    results = itertools.imap(analyzeFile, tasks)
+
+  tables = Tables(directory)
+  analyzed, failed = 0, 0
+  try:
+    for path, row, curve, error in results:
+      if error is not None:
+        print 'Could not analyze %s (%s)' % (path, error)
+        failed += 1
+        continue
+      tables.add(path, row, curve)
+      analyzed += 1
+  finally:
+    tables.close()
+    if pool is not None:
+      pool.terminate()
+  print 'Analyzed %d games (%d failed) into %s' % (analyzed, failed, directory)
+  for name, counts in sorted(tables.layouts.items()):
+    total = float(sum(counts))
+    print '%-30s %5d games, red wins %.2f, ties %.2f, blue wins %.2f' % ((name,
+        int(total)) + tuple(c / total for c in counts))
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('-o', '--output', default='analytics',
+                    help='The directory of the tables [Default: %default]')
+  parser.add_option('-w', '--workers', type='int', default=0,
+                    help='Number of worker processes [Default: one per CPU]')
+  parser.add_option('-i', '--interval', type='int', default=100,
+                    help='Moves between the points of the food curves [Default: %default]')
+  options, paths = parser.parse_args(argv)
+  if not paths:
+    parser.error('Give the recordings or directories to analyze')
+  if not options.workers:
+    import multiprocessing
+    options.workers = multiprocessing.cpu_count()
+  return options, paths
+
+if __name__ == '__main__':
+  options, paths = readCommand(sys.argv[1:])
+  runAnalytics(paths, options.output, options.workers, options.interval)
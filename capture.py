@@ -50,14 +50,67 @@ import sys, util, types, time, random
 KILL_POINTS = 0
 SONAR_NOISE_RANGE = 13 # Must be odd
 SONAR_NOISE_VALUES = [i - (SONAR_NOISE_RANGE - 1)/2 for i in range(SONAR_NOISE_RANGE)]
+SONAR_MAX_NOISE = max(SONAR_NOISE_VALUES)
+SONAR_NOISE_PROBS = dict((v, 1.0/SONAR_NOISE_RANGE) for v in SONAR_NOISE_VALUES)
 SIGHT_RANGE = 5 # Manhattan distance
 MIN_FOOD = 2
 
 SCARED_TIME = 40
 
+# Caches for the sonar emission model, shared by every state of a layout
+SONAR_TABLE_CACHE = {}
+SONAR_MASK_CACHE = {}
+SONAR_MASK_CACHE_SIZE = 5000
+
 def noisyDistance(pos1, pos2):
   return int(util.manhattanDistance(pos1, pos2) + random.choice(SONAR_NOISE_VALUES))
 
+def getEmissionTable(maxDistance):
+  """
+  Returns the sonar emission model as a table, where
+  table[trueDistance][noisyDistance + SONAR_MAX_NOISE] is the probability of
+  reading noisyDistance when the true distance is trueDistance. Tables are
+  built once per maxDistance and shared.
+  """
+  if maxDistance not in SONAR_TABLE_CACHE:
+    width = maxDistance + 2 * SONAR_MAX_NOISE + 1
+    table = []
+    for trueDistance in range(maxDistance + 1):
+      row = [0.0] * width
+      for noise, prob in SONAR_NOISE_PROBS.items():
+        row[trueDistance + noise + SONAR_MAX_NOISE] = prob
+      table.append(row)
+    SONAR_TABLE_CACHE[maxDistance] = table
+  return SONAR_TABLE_CACHE[maxDistance]
+
+def getLayoutKey(layout):
+  "The text of layout as a tuple, built once per layout, to key the caches on"
+  key = getattr(layout, 'cacheKey', None)
+  if key is None:
+    key = layout.cacheKey = tuple(layout.layoutText)
+  return key
+
+def getEmissionMask(layout, position, noisyDistance):
+  """
+  Returns the likelihood of noisyDistance, observed from position, for every
+  legal cell of the layout as a dict from cell to P(noisy | cell). Masks are
+  cached per layout, position and reading, so trackers can weight all of
+  their particles against a single lookup table.
+  """
+  key = (getLayoutKey(layout), position, noisyDistance)
+  if key not in SONAR_MASK_CACHE:
+    if len(SONAR_MASK_CACHE) >= SONAR_MASK_CACHE_SIZE:
+      SONAR_MASK_CACHE.clear()
+    walls = layout.walls
+    table = getEmissionTable(walls.width + walls.height)
+    column = noisyDistance + SONAR_MAX_NOISE
+    mask = {}
+    for cell in walls.asList(False):
+      row = table[int(manhattanDistance(position, cell))]
+      mask[cell] = row[column] if 0 <= column < len(row) else 0.0
+    SONAR_MASK_CACHE[key] = mask
+  return SONAR_MASK_CACHE[key]
+
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
 ###################################################
@@ -195,10 +248,14 @@ class GameState:
 
   def getDistanceProb(self, trueDistance, noisyDistance):
     "Returns the probability of a noisy distance given the true distance"
-    if noisyDistance - trueDistance in SONAR_NOISE_VALUES:
-      return 1.0/SONAR_NOISE_RANGE
-    else:
-      return 0
+    return SONAR_NOISE_PROBS.get(noisyDistance - trueDistance, 0)
+
+  def getDistanceMask(self, position, noisyDistance):
+    """
+    Returns P(noisyDistance | cell) for every legal cell, as read by an agent
+    standing at position. See getEmissionMask.
+    """
+    return getEmissionMask(self.data.layout, position, noisyDistance)
 
   def getInitialAgentPosition(self, agentIndex):
     "Returns the initial position of an agent."
@@ -620,10 +677,21 @@ def readCommand( argv ):
                     help=default('Number of games to play'), default=1)
   parser.add_option('-f', '--fixRandomSeed', action='store_true',
                     help='Fixes the random seed to always play the same game', default=False)
+  parser.add_option('--seed', type='int', default=None,
+                    help='Seeds every game from SEED, so that each can be played again on its own. '
+                         'Teams with a fixedBudget argument (such as T) are given fixedBudget=True; '
+                         'other teams that adapt to the time they take may not play the same game again')
+  parser.add_option('--gameSeed', type='int', default=None,
+                    help='Plays the game of a seeded run that had this seed (as printed or recorded), '
+                         'with fixed budgets as for --seed')
   parser.add_option('--record', action='store_true',
                     help='Writes game histories to a file (named by the time they were played)', default=False)
   parser.add_option('--replay', default=None,
                     help='Replays a recorded game file.')
+  parser.add_option('--replayStart', type='int', default=0,
+                    help='Starts the replay after this many moves')
+  parser.add_option('--results', default=None,
+                    help='Appends a JSON line with the result of every game to this file')
   parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                     help=default('How many episodes are training (suppresses output)'), default=0)
   parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
@@ -659,12 +727,13 @@ def readCommand( argv ):
     args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime, capture=True)
 
   if options.fixRandomSeed: random.seed('cs188')
+  if options.seed is not None: random.seed(util.deriveSeed(options.seed, 'setup'))
 
   # Special case: recorded games don't use the runGames method or args structure
   if options.replay != None:
     print 'Replaying recorded game %s.' % options.replay
-    import cPickle
-    recorded = cPickle.load(open(options.replay))
+    import replay
+    recorded = replay.loadReplay(options.replay, options.replayStart)
     recorded['display'] = args['display']
     replayGame(**recorded)
     sys.exit(0)
@@ -675,10 +744,11 @@ def readCommand( argv ):
     redArgs['numTraining'] = options.numTraining
     blueArgs['numTraining'] = options.numTraining
   nokeyboard = options.textgraphics or options.quiet or options.numTraining > 0
+  seeded = options.seed is not None or options.gameSeed is not None
   print '\nRed team %s with %s:' % (options.red, redArgs)
-  redAgents = loadAgents(True, options.red, nokeyboard, redArgs)
+  redAgents = loadAgents(True, options.red, nokeyboard, redArgs, seeded)
   print '\nBlue team %s with %s:' % (options.blue, blueArgs)
-  blueAgents = loadAgents(False, options.blue, nokeyboard, blueArgs)
+  blueAgents = loadAgents(False, options.blue, nokeyboard, blueArgs, seeded)
   args['agents'] = sum([list(el) for el in zip(redAgents, blueAgents)],[]) # list of agents
 
   # Choose a layout
@@ -695,6 +765,12 @@ def readCommand( argv ):
   args['numTraining'] = options.numTraining
   args['record'] = options.record
   args['catchExceptions'] = options.catchExceptions
+  args['seed'] = options.seed
+  args['results'] = options.results
+  args['teams'] = {'red': options.red, 'blue': options.blue,
+                   'redOpts': redArgs, 'blueOpts': blueArgs}
+  if options.gameSeed is not None:
+    args['gameSeeds'] = [options.gameSeed] * options.numGames
   return args
 
 def randomLayout():
@@ -707,8 +783,13 @@ def randomLayout():
   return layout
 
 import traceback
-def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
-  "Calls agent factories and returns lists of agents"
+def loadAgents(isRed, factory, textgraphics, cmdLineArgs, seeded=False):
+  """
+  Calls agent factories and returns lists of agents. For a seeded game, teams
+  whose config has a fixedBudget argument get fixedBudget=True (unless it is
+  given on the command line), so that they do not adapt to the time they take
+  and the game can be played again from its seed.
+  """
   # Looks through all pythonPath Directories for the right module
   import os
   dirname = 'teams/'
@@ -723,6 +804,8 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
 
   factory = factory + "." + conf.AgentFactory
   args = dict(conf.AgentArgs)
+  if seeded and 'fixedBudget' in args:
+    args['fixedBudget'] = 'True'
   args.update(cmdLineArgs)  # Add command line args with priority
 
   print "Loading Team:", conf.TeamName
@@ -759,9 +842,14 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
   indices = [2*i + indexAddend for i in range(3)]
   return [foundFactory.getAgent(i) for i in indices]
 
-def replayGame( layout, agents, actions, display, length ):
+def replayGame( layout, agents, actions, display, length, seed=None, state=None ):
+    "Replays actions from the start of the game, or from state if given"
+    if seed is not None:
+      print 'The game was played with --gameSeed %d' % seed
     rules = CaptureRules()
     game = rules.newGame( layout, agents, display, length, False, False )
+    if state is not None:
+      game.state = state
     state = game.state
     display.initialize(state.data)
 
@@ -775,13 +863,61 @@ def replayGame( layout, agents, actions, display, length ):
 
     display.finish()
 
-def runGames( layout, agents, display, length, numGames, record, numTraining, muteAgents=False, catchExceptions=False ):
+def getGameRecord( game, rules, layout, teams=None ):
+  """
+  The result of a finished game as a dict that can be written as JSON: the
+  teams and their options (teams, as passed to runGames), the layout, seed,
+  score and winner, the number of moves, the food eaten by each side, the
+  agent that crashed and whether it ran out of time, and the time used and
+  time warnings of every agent
+  """
+  state = game.state
+  score = state.data.score
+  record = dict(teams or {})
+  record.update({
+    'layout': layout.name,
+    'seed': game.seed,
+    'length': game.length,
+    'score': score,
+    'winner': 'Red' if score > 0 else 'Blue' if score < 0 else 'Tie',
+    'moves': len(game.moveHistory),
+    'foodEaten': {'red': rules._initBlueFood - state.getBlueFood().count(),
+                  'blue': rules._initRedFood - state.getRedFood().count()},
+    'crashedAgent': game.crashedAgent,
+    'timeout': game.agentTimeout,
+    'agents': [{'index': i, 'team': ['red', 'blue'][i % 2],
+                'totalTime': game.totalAgentTimes[i],
+                'maxMoveTime': game.maxAgentTimes[i],
+                'warnings': game.totalAgentTimeWarnings[i]}
+               for i in range(len(game.agents))]})
+  return record
+
+def getGameSeeds( seed, numGames ):
+  "The seeds of the games of a run seeded with seed: game i gets deriveSeed(seed, i)"
+  return [util.deriveSeed(seed, i) for i in range(numGames)]
+
+def runGames( layout, agents, display, length, numGames, record, numTraining, muteAgents=False, catchExceptions=False, seed=None, gameSeeds=None, results=None, teams=None ):
+  """
+  Plays numGames games. If seed or gameSeeds (the seed of each game) is
+  given, every game draws its random numbers from separate streams for the
+  engine and for each team (see util.RandomStreams), seeded by the seed of
+  the game, which is kept in Game.seed and in its recording.
+
+  If results (a file name) is given, the record of every game (see
+  getGameRecord, which adds teams to it) is appended to it as a JSON line.
+  """
   # Hack for agents writing to the display
   import __main__
   __main__.__dict__['_display'] = display
 
   rules = CaptureRules()
   games = []
+  if gameSeeds is None and seed is not None:
+    gameSeeds = getGameSeeds(seed, numGames)
+  agentStreams = [['red', 'blue'][i % 2] for i in range(len(agents))]
+  if results is not None:
+    import json
+    resultsFile = open(results, 'a')
 
   if numTraining > 0:
     print 'Playing %d training games' % numTraining
@@ -796,21 +932,31 @@ def runGames( layout, agents, display, length, numGames, record, numTraining, mu
     else:
         gameDisplay = display
         rules.quiet = False
+    if gameSeeds is not None:
+      # The engine's stream is current until the first agent is called
+      streams = util.RandomStreams(gameSeeds[i], agentStreams)
+      print 'Game %d seed: %d' % (i, gameSeeds[i])
     g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
-    g.run()
-    if not beQuiet: games.append(g)
-
+    if gameSeeds is not None:
+      g.setSeed(gameSeeds[i], streams)
     # Enabling to students to record - addition by Lon
+    # The moves are written as they are made, so a game cut short is kept
     g.record = None
     if record:
-      import time, cPickle, game
+      import time, replay
       fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      f = file(fname, 'w')
-      components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length}
+      g.setRecorder(replay.ReplayWriter(fname, layout, len(agents), length, g.seed,
+                                        teams, live=True))
+      g.record = fname
+    g.run()
+    if not beQuiet: games.append(g)
+    if results is not None:
+      gameRecord = getGameRecord(g, rules, layout, teams)
+      gameRecord['training'] = beQuiet
+      resultsFile.write(json.dumps(gameRecord) + '\n')
+      resultsFile.flush()
+    if record:
       print "recorded"
-      g.record = cPickle.dumps(components)
-      f.write(g.record)
-      f.close()
 
 # # # Before enabling students to record: code for tournament recording
 #    if record:
@@ -822,6 +968,9 @@ def runGames( layout, agents, display, length, numGames, record, numTraining, mu
 #      print "recorded"
 #      g.record = cPickle.dumps(components)
 
+  if results is not None:
+    resultsFile.close()
+
   if numGames > 1:
     scores = [game.state.data.score for game in games]
     redWinRate = [s > 0 for s in scores].count(True)/ float(len(scores))
@@ -0,0 +1,330 @@
+# dataset.py
+# ----------
+# Datasets of the features of recorded games, and an offline weight trainer.
+
+"""
+Learns the offensive and defensive weights of teams/T/weights.py from
+recorded games, without replaying them for every pass.
+
+The export command plays every recording again, in a pool of worker
+processes, with the agents of teams/T (agents.ReplayAgent wrapped in
+agents.LearningAgent) moving as recorded and tracking as they would in play.
+For every move of every agent, it writes the features of each legal action
+and the action that was chosen. A dataset is a gzipped JSON file per
+recording, with a column for each of:
+
+  sample   the number of the move in the dataset (the rows of a move share it)
+  move     the number of the move in the game
+  agent    the index of the agent
+  role     offensive or defensive, the strategy whose features these are
+  action   the legal action of the row
+  chosen   1 for the action that was played, 0 for the others
+  and a column for each feature, 0 where it is not given
+
+The moves with a feature that is not finite (score is infinite when an
+action wins the game) are left out, as they cannot be trained on.
+
+The train command fits the weights of a role to the datasets, so that the
+action played has the highest value among the legal ones. The losses are
+  perceptron  the averaged perceptron, as agents.LearningAgent learns online
+  logistic    the log-likelihood of the chosen action under a softmax
+  ranking     a hinge loss on the margin of the chosen action over each other
+The features are scaled to [-1, 1] for training, and the current weights
+(the starting point) so that the largest is 1. The weights found are scaled
+back, and then all together so that the largest has the size of the largest
+current weight (the choices of a strategy do not depend on their scale).
+
+USAGE: python dataset.py export -o datasets -w 4 recordings/
+       python dataset.py train -r offensive -e 20 --write datasets/
+"""
+
+import os
+import sys
+import gzip
+import json
+import math
+import random
+import itertools
+
+import replay
+from analytics import findRecordings
+
+ROLES = ['offensive', 'defensive']
+STRATEGIES = {'offensive': 'ContestOffensive', 'defensive': 'ContestDefensive'}
+LOSSES = ['perceptron', 'logistic', 'ranking']
+
+def getDatasetPath(directory, recording):
+  return os.path.join(directory, os.path.basename(recording) + '.json.gz')
+
+def getSamples(recording):
+  """
+  Plays a recording again with the agents of teams/T, starting with the agent
+  that moved first in it. Returns the samples of every agent, as
+  (agentIndex, role, [({action: features}, chosen)])
+  """
+  import capture
+  import textDisplay
+  recorded = replay.loadReplay(recording)
+  actions = recorded['actions']
+  numAgents = len(recorded['agents'])
+  args = {'replay': repr(recording),
+          'first': repr({'learn': STRATEGIES[ROLES[0]]}),
+          'second': repr({'learn': STRATEGIES[ROLES[1]]})}
+
+  # The agents print a lot, which is not wanted here
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    redAgents = capture.loadAgents(True, 'T', True, args)
+    blueAgents = capture.loadAgents(False, 'T', True, args)
+    agents = sum([list(el) for el in zip(redAgents, blueAgents)], [])[:numAgents]
+    rules = capture.CaptureRules()
+    game = rules.newGame(recorded['layout'], agents, textDisplay.NullGraphics(),
+                         len(actions), False, False)
+    if actions:
+      game.startingIndex = actions[0][0]
+    game.run()
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  if map(tuple, game.moveHistory) != map(tuple, actions):
+    raise Exception('The game was not played again as recorded')
+  return [(agent.index, ROLES[agent.index // 2 % 2], agent.samples) for agent in agents]
+
+def isFinite(value):
+  return not (math.isinf(value) or math.isnan(value))
+
+def getColumns(samples):
+  "The columns of a dataset of samples, as a dict, but for the moves not finite"
+  names = sorted(set(name for _, _, moves in samples for data, _ in moves
+                     for features in data.values() for name in features))
+  columns = dict((name, []) for name in
+                 ['sample', 'move', 'agent', 'role', 'action', 'chosen'] + names)
+  sample, numAgents = 0, len(samples)
+  for agentIndex, role, moves in samples:
+    for move, (data, chosen) in enumerate(moves):
+      if not all(isFinite(v) for features in data.values() for v in features.values()):
+        continue
+      for action in sorted(data):
+        columns['sample'].append(sample)
+        columns['move'].append(move * numAgents + agentIndex)
+        columns['agent'].append(agentIndex)
+        columns['role'].append(role)
+        columns['action'].append(action)
+        columns['chosen'].append(int(action == chosen))
+        for name in names:
+          columns[name].append(data[action][name])
+      sample += 1
+  return columns, names
+
+def exportFile(task):
+  "Writes the dataset of a recording. Returns (recording, samples, error)"
+  recording, directory = task
+  try:
+    columns, names = getColumns(getSamples(recording))
+    out = gzip.open(getDatasetPath(directory, recording), 'wb')
+    json.dump({'recording': recording, 'features': names, 'columns': columns}, out)
+    out.close()
+    return recording, len(set(columns['sample'])), None
+  except Exception, e:
+    return recording, 0, '%s: %s' % (type(e).__name__, e)
+
+def runExport(paths, directory, numWorkers=1):
+  "Writes the datasets of the recordings in paths to directory"
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  tasks = ((path, directory) for path in findRecordings(paths))
+  pool = None
+  if numWorkers > 1:
+    import multiprocessing
+    pool = multiprocessing.Pool(numWorkers)
+    results = pool.imap_unordered(exportFile, tasks)
+  else:
+    results = itertools.imap(exportFile, tasks)
+  exported, failed, total = 0, 0, 0
+  try:
+    for recording, samples, error in results:
+      if error is not None:
+        print 'Could not export %s (%s)' % (recording, error)
+        failed += 1
+      else:
+        print 'Exported %s: %d moves' % (recording, samples)
+        exported += 1
+        total += samples
+  finally:
+    if pool is not None:
+      pool.terminate()
+  print 'Exported %d games (%d failed), %d moves, to %s' % (exported, failed,
+                                                           total, directory)
+
+def loadSamples(paths, role):
+  """
+  The moves of role in the datasets in paths (files or directories), as
+  (feature names, [(rows, chosen)]) where rows has the features of each
+  legal action and chosen is the index of the row that was played. Moves
+  with features that are not finite are skipped.
+  """
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                   if name.endswith('.json.gz'))
+    else:
+      files.append(path)
+
+  datasets = [json.load(gzip.open(path, 'rb')) for path in files]
+  names = sorted(set(name for dataset in datasets for name in dataset['features']))
+  samples = []
+  for dataset in datasets:
+    columns = dataset['columns']
+    features = [columns.get(name) for name in names]
+    moves = {}
+    for i, sample in enumerate(columns['sample']):
+      if columns['role'][i] != role:
+        continue
+      rows, chosen = moves.setdefault(sample, ([], []))
+      if columns['chosen'][i]:
+        chosen.append(len(rows))
+      rows.append([0.0 if column is None else column[i] for column in features])
+    samples.extend((rows, chosen[0]) for rows, chosen in
+                   (moves[k] for k in sorted(moves)) if len(rows) > 1 and chosen
+                   and all(isFinite(v) for x in rows for v in x))
+
+  # Only the features of the strategy of role
+  used = [j for j in range(len(names))
+          if any(x[j] for rows, _ in samples for x in rows)]
+  samples = [([[x[j] for j in used] for x in rows], chosen) for rows, chosen in samples]
+  return [names[j] for j in used], samples
+
+def dot(w, x):
+  return sum(a * b for a, b in zip(w, x))
+
+def getAccuracy(w, samples):
+  "The fraction of samples in which the chosen action alone has the highest value"
+  right = 0
+  for rows, chosen in samples:
+    values = [dot(w, x) for x in rows]
+    best = max(values)
+    right += values[chosen] == best and values.count(best) == 1
+  return float(right) / max(1, len(samples))
+
+def train(samples, initial, loss='perceptron', epochs=10, rate=0.1, rng=random):
+  """
+  Fits a weight vector to samples (as given by loadSamples, with features
+  already scaled), starting from initial. Returns the weights.
+  """
+  w = list(initial)
+  total, count = [0.0] * len(w), 0
+  order = range(len(samples))
+  for epoch in range(epochs):
+    rng.shuffle(order)
+    for k in order:
+      rows, chosen = samples[k]
+      values = [dot(w, x) for x in rows]
+      x = rows[chosen]
+      if loss == 'perceptron':
+        best = max(range(len(rows)), key=lambda i: (values[i], i == chosen))
+        if best != chosen:
+          w = [a + rate * (b - c) for a, b, c in zip(w, x, rows[best])]
+        total = [a + b for a, b in zip(total, w)]
+        count += 1
+      elif loss == 'logistic':
+        top = max(values)
+        exps = [math.exp(v - top) for v in values]
+        z = sum(exps)
+        expected = [sum(e * row[j] for e, row in zip(exps, rows)) / z
+                    for j in range(len(w))]
+        w = [a + rate * (b - c) for a, b, c in zip(w, x, expected)]
+      else:
+        for i, row in enumerate(rows):
+          if i != chosen and values[chosen] - values[i] < 1:
+            w = [a + rate * (b - c) for a, b, c in zip(w, x, row)]
+  if loss == 'perceptron' and count:
+    w = [a / count for a in total]
+  return w
+
+def fitWeights(paths, role, current, loss='perceptron', epochs=10, rate=0.1, seed=0):
+  """
+  Fits the weights of role to the datasets in paths, starting from the
+  current weights, which are kept for the features never seen. Returns the
+  weights, the number of moves and the accuracy before and after.
+  """
+  names, samples = loadSamples(paths, role)
+  if not samples:
+    raise Exception('No moves of the %s role in the datasets' % role)
+  scales = [max(abs(x[j]) for rows, _ in samples for x in rows) or 1.0
+            for j in range(len(names))]
+  scaled = [([[v / s for v, s in zip(x, scales)] for x in rows], chosen)
+            for rows, chosen in samples]
+  initial = [current.get(name, 0.0) * s for name, s in zip(names, scales)]
+  initial = [v / (max(abs(v) for v in initial) or 1.0) for v in initial]
+  w = train(scaled, initial, loss, epochs, rate, random.Random(seed))
+  before, after = getAccuracy(initial, scaled), getAccuracy(w, scaled)
+
+  weights = [v / s for v, s in zip(w, scales)]
+  largest = max(abs(v) for v in weights)
+  if current and largest:
+    factor = max(abs(v) for v in current.values()) / largest
+    weights = [v * factor for v in weights]
+  learned = dict(current)
+  learned.update(zip(names, weights))
+  return learned, len(samples), before, after
+
+def runTraining(paths, role, loss, epochs, rate, seed, write, weightsPath):
+  from evolve import loadWeights, writeWeights, formatWeights
+  current = dict(zip(ROLES, loadWeights(weightsPath)))[role]
+  weights, count, before, after = fitWeights(paths, role, current, loss, epochs,
+                                             rate, seed)
+  print 'Trained %s weights on %d moves: %.3f of the moves chosen before, %.3f after' % (
+      role, count, before, after)
+  print formatWeights(role, weights)
+  if write and not all(isFinite(v) for v in weights.values()):
+    raise Exception('Not writing the weights, some are not finite')
+  if write:
+    writeWeights(role, weights, 'Learned offline with the %s loss from %d moves (%.3f chosen)'
+                 % (loss, count, after), weightsPath)
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  from evolve import WEIGHTS_FILE
+  parser = OptionParser(__doc__)
+  parser.add_option('-o', '--output', default='datasets',
+                    help='The directory of the datasets [Default: %default]')
+  parser.add_option('-w', '--workers', type='int', default=0,
+                    help='Number of worker processes [Default: one per CPU]')
+  parser.add_option('-r', '--role', default='offensive',
+                    help='The weights to train, offensive or defensive [Default: %default]')
+  parser.add_option('-l', '--loss', default='perceptron',
+                    help='perceptron, logistic or ranking [Default: %default]')
+  parser.add_option('-e', '--epochs', type='int', default=10,
+                    help='Passes over the moves [Default: %default]')
+  parser.add_option('--rate', type='float', default=0.1,
+                    help='The learning rate [Default: %default]')
+  parser.add_option('-s', '--seed', type='int', default=0,
+                    help='Seed of the order of the moves [Default: %default]')
+  parser.add_option('--weights', default=WEIGHTS_FILE,
+                    help='The weights file [Default: %default]')
+  parser.add_option('--write', action='store_true', default=False,
+                    help='Write the weights to the weights file, keeping the old ones as comments')
+  options, args = parser.parse_args(argv)
+  if not args or args[0] not in ('export', 'train'):
+    parser.error('Give the command, export or train')
+  if len(args) < 2:
+    parser.error('Give the recordings or datasets')
+  if options.role not in ROLES:
+    parser.error('Unknown role ' + options.role)
+  if options.loss not in LOSSES:
+    parser.error('Unknown loss ' + options.loss)
+  if not options.workers:
+    import multiprocessing
+    options.workers = multiprocessing.cpu_count()
+  return args[0], args[1:], options
+
+if __name__ == '__main__':
+  command, paths, options = readCommand(sys.argv[1:])
+  if command == 'export':
+    runExport(paths, options.output, options.workers)
+  else:
+    runTraining(paths, options.role, options.loss, options.epochs, options.rate,
+                options.seed, options.write, options.weights)
@@ -0,0 +1,567 @@
+# evolve.py
+# ---------
+# Tunes the feature weights of a team by playing games, replacing evolve.go.
+
+"""
+Evolves the offensive or defensive weights of teams/T/weights.py. Every
+generation, an optimizer proposes a population of weight dicts, each of which
+plays a number of quiet games on every layout against a fixed opponent, and
+is scored by its mean final score. The games run in a pool of worker
+processes that stay up for the whole run and call capture.runGames directly.
+At the end, the best weights found are written back to weights.py.
+
+Three optimizers are available:
+  genetic       mutation and averaging crossover, as evolve.go did
+  cmaes         CMA-ES with a diagonal covariance (sep-CMA-ES)
+  crossentropy  the cross-entropy method with a diagonal Gaussian
+
+All of them search in a normalized space, in which every weight is divided by
+the magnitude of its initial value, so that a step of sigma = 0.25 changes any
+weight by about a quarter.
+
+With --racing, the candidates race through their games and the clearly
+worse ones stop playing early (see RacingEvaluator), so that most games are
+spent on the promising candidates.
+
+With --store, every generation is recorded in an experiment store (see
+experiments.py), from which an interrupted run can be resumed with --resume.
+
+USAGE: python evolve.py -o cmaes -g 25 -p 8 -n 2 -l contest03Capture,defaultCapture
+"""
+
+import os
+import sys
+import math
+import random
+import time
+
+import capture
+import layout
+import textDisplay
+
+WEIGHTS_FILE = 'teams/T/weights.py'
+GENERATIONS = 25
+
+def playGame(task):
+  """
+  Plays one quiet game. Returns its final score (positive if red won), its
+  wall-clock time, and the time used and warnings got by every agent.
+  """
+  red, redArgs, blue, blueArgs, layoutName, length, seed = task
+  random.seed(seed)
+  start = time.time()
+
+  # The games and agents print a lot, which is not wanted here
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    redAgents = capture.loadAgents(True, red, True, redArgs)
+    blueAgents = capture.loadAgents(False, blue, True, blueArgs)
+    agents = sum([list(el) for el in zip(redAgents, blueAgents)], [])
+    gameLayout = layout.getLayout(layoutName)
+    agents = agents[:gameLayout.getNumGhosts()]
+    games = capture.runGames(gameLayout, agents, textDisplay.NullGraphics(),
+                             length, 1, False, 0, True, True, gameSeeds=[seed])
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  game = games[0]
+  return (game.state.data.score, time.time() - start, game.totalAgentTimes,
+          game.totalAgentTimeWarnings)
+
+def getScores(results):
+  return [result[2] for result in results]
+
+def mean(values):
+  return sum(values) / float(len(values))
+
+def standardError(values):
+  "The standard error of the mean of values"
+  if len(values) < 2:
+    return float('inf')
+  m = mean(values)
+  return math.sqrt(sum((x - m) ** 2 for x in values) / (len(values) - 1) / len(values))
+
+class Evaluator:
+  """
+  Scores weight dicts by playing games as the red team. Every candidate of a
+  generation plays the same games (layouts and random seeds), which makes
+  their scores easier to compare. Games run in numWorkers processes, or in
+  this process if numWorkers is at most 1, or on the workers of the farm
+  coordinator at address farm (see farm.py).
+
+  The games played by every candidate of the last generation are kept in
+  self.results as (layout, seed, score, seconds, agentTimes, warnings).
+  """
+  def __init__(self, train, fixed, layouts, gamesPerLayout, length,
+               red='T', redArgs={}, blue='BaselineAgents', blueArgs={},
+               numWorkers=1, rng=random, farm=None):
+    self.train = train
+    self.fixed = fixed
+    self.layouts = layouts
+    self.gamesPerLayout = gamesPerLayout
+    self.length = length
+    self.red, self.redArgs = red, redArgs
+    self.blue, self.blueArgs = blue, blueArgs
+    self.rng = rng
+    self.played = 0
+    self.results = []
+    self.pool = None
+    if farm is not None:
+      import farm as gameFarm
+      self.pool = gameFarm.FarmPool(farm)
+    elif numWorkers > 1:
+      import multiprocessing
+      self.pool = multiprocessing.Pool(numWorkers)
+
+  def getArgs(self, weights):
+    "The red team's arguments to play with weights"
+    args = dict(self.redArgs)
+    other = 'defensive' if self.train == 'offensive' else 'offensive'
+    args[self.train + 'Weights'] = repr(weights)
+    args[other + 'Weights'] = repr(self.fixed)
+    return args
+
+  def getGames(self):
+    """
+    The games of a generation as (layout, seed) pairs, in rounds that cover
+    every layout once
+    """
+    return [(name, self.rng.getrandbits(31)) for _ in range(self.gamesPerLayout)
+            for name in self.layouts]
+
+  def play(self, candidates, games):
+    "Returns the results of every weight dict in candidates in each of games"
+    tasks = [(self.red, self.getArgs(weights), self.blue, self.blueArgs, name,
+              self.length, seed) for weights in candidates for name, seed in games]
+    if self.pool is not None:
+      results = self.pool.map(playGame, tasks)
+    else:
+      results = map(playGame, tasks)
+    self.played += len(tasks)
+    results = [(name, seed) + result for (_, _, _, _, name, _, seed), result
+               in zip(tasks, results)]
+    n = len(games)
+    return [results[i * n:(i + 1) * n] for i in range(len(candidates))]
+
+  def evaluate(self, candidates):
+    "Returns the mean score of every weight dict in candidates"
+    self.results = self.play(candidates, self.getGames())
+    return [mean(getScores(results)) for results in self.results]
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool = None
+
+class RacingEvaluator(Evaluator):
+  """
+  Evaluates a generation in rounds instead of playing every game with every
+  candidate (successive halving). The first round plays one game per layout
+  and every round plays twice as many as the one before. After each round,
+  the candidates that are surely worse than the leader are dropped: those
+  whose score difference with the leader, paired by game, is negative by
+  more than confidence standard errors. Then only the best keep fraction of
+  the rest go on to the next round. The race ends when a single candidate
+  remains or the games run out.
+
+  All candidates play the same games, so the rounds they did play can be
+  compared. A dropped candidate is scored by its mean, but no higher than the
+  candidates that outlasted it, so that the ranking follows the race.
+  """
+  def __init__(self, *args, **kwargs):
+    self.keep = kwargs.pop('keep', 0.5)
+    self.confidence = kwargs.pop('confidence', 2.0)
+    Evaluator.__init__(self, *args, **kwargs)
+
+  def evaluate(self, candidates):
+    games = self.getGames()
+    self.results = [[] for _ in candidates]
+    scores = [[] for _ in candidates]
+    alive = range(len(candidates))
+    dropped = []
+    played, size = 0, len(self.layouts)
+    while played < len(games) and len(alive) > 1:
+      batch = games[played:played + size]
+      for i, results in zip(alive, self.play([candidates[i] for i in alive], batch)):
+        self.results[i].extend(results)
+        scores[i].extend(getScores(results))
+      played += len(batch)
+      size *= 2
+
+      # Drop the candidates beaten with confidence, then all but the best
+      ranked = sorted(alive, key=lambda i: -mean(scores[i]))
+      leader = scores[ranked[0]]
+      survivors = []
+      for i in ranked:
+        differences = [a - b for a, b in zip(scores[i], leader)]
+        if mean(differences) + self.confidence * standardError(differences) >= 0:
+          survivors.append(i)
+      survivors = survivors[:max(1, int(math.ceil(len(alive) * self.keep)))]
+      dropped.append([i for i in ranked if i not in survivors])
+      alive = survivors
+
+    # Ranks the candidates by the round they were dropped in
+    result = [None] * len(candidates)
+    ceiling = float('inf')
+    for group in [alive] + dropped[::-1]:
+      if not group:
+        continue
+      for i in group:
+        result[i] = min(mean(scores[i]), ceiling)
+      ceiling = min(result[i] for i in group)
+    return result
+
+class Optimizer:
+  """
+  The common part of the optimizers: the mapping between weight dicts and
+  normalized vectors, and the best candidate seen so far. Subclasses
+  implement ask, which returns the vectors of the next generation, and tell,
+  which is given their scores (higher is better).
+  """
+  def __init__(self, initial, population, sigma=0.25, rng=random):
+    self.names = sorted(initial.keys())
+    self.scales = [abs(initial[n]) or 1.0 for n in self.names]
+    self.mean = [initial[n] / s for n, s in zip(self.names, self.scales)]
+    self.population = population
+    self.sigma = sigma
+    self.rng = rng
+    self.best, self.bestScore = dict(initial), None
+
+  def getState(self):
+    "The state of the optimizer between generations, without its rng"
+    state = dict(self.__dict__)
+    del state['rng']
+    return state
+
+  def setState(self, state):
+    self.__dict__.update(state)
+
+  def toWeights(self, vector):
+    return dict((n, x * s) for n, x, s in zip(self.names, vector, self.scales))
+
+  def record(self, vectors, scores):
+    "Keeps the best candidate and returns the vectors sorted by score"
+    ranked = sorted(zip(scores, vectors), key=lambda (s, v): -s)
+    if self.bestScore is None or ranked[0][0] > self.bestScore:
+      self.bestScore = ranked[0][0]
+      self.best = self.toWeights(ranked[0][1])
+    return [v for s, v in ranked]
+
+class Genetic(Optimizer):
+  """
+  Each coordinate of each vector is mutated with probability 1/2 by a normal
+  step of sigma times its magnitude (at least 0.1, so that zero weights can
+  move). After scoring, the best vector is kept as is and the rest of the
+  population are averages of random pairs of the top half.
+  """
+  def __init__(self, initial, population, sigma=0.25, rng=random):
+    Optimizer.__init__(self, initial, population, sigma, rng)
+    self.vectors = [self.mean[:] for _ in range(population)]
+    self.elitism = False
+
+  def mutate(self, vector):
+    return [x + self.rng.gauss(0, self.sigma * max(abs(x), 0.1))
+            if self.rng.random() < 0.5 else x for x in vector]
+
+  def ask(self):
+    "Mutates every vector but the best of the last generation (the first)"
+    return [v if i == 0 and self.elitism else self.mutate(v)
+            for i, v in enumerate(self.vectors)]
+
+  def tell(self, vectors, scores):
+    ranked = self.record(vectors, scores)
+    parents = ranked[:max(2, len(ranked) / 2)]
+    self.elitism = True
+    self.vectors = [ranked[0]]
+    while len(self.vectors) < self.population:
+      dad, mom = self.rng.sample(parents, 2)
+      self.vectors.append([(a + b) / 2.0 for a, b in zip(dad, mom)])
+
+class CMAES(Optimizer):
+  """
+  CMA-ES with a diagonal covariance matrix (sep-CMA-ES, Ros and Hansen 2008),
+  which only needs O(n) work per sample and no linear algebra. Uses the
+  standard parameters for the population size.
+  """
+  def __init__(self, initial, population, sigma=0.25, rng=random):
+    Optimizer.__init__(self, initial, population, sigma, rng)
+    n = len(self.names)
+    mu = population / 2
+    weights = [math.log(mu + 0.5) - math.log(i + 1) for i in range(mu)]
+    self.weights = [w / sum(weights) for w in weights]
+    self.mueff = 1.0 / sum(w * w for w in self.weights)
+    mueff = self.mueff
+
+    self.cs = (mueff + 2) / (n + mueff + 5)
+    self.ds = 1 + 2 * max(0, math.sqrt((mueff - 1) / (n + 1)) - 1) + self.cs
+    self.cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    self.c1 = 2 / ((n + 1.3) ** 2 + mueff) * (n + 2) / 3.0
+    self.cmu = min(1 - self.c1, 2 * (mueff - 2 + 1 / mueff) /
+                   ((n + 2) ** 2 + mueff) * (n + 2) / 3.0)
+    self.chiN = math.sqrt(n) * (1 - 1.0 / (4 * n) + 1.0 / (21 * n * n))
+
+    self.variances = [1.0] * n
+    self.ps = [0.0] * n
+    self.pc = [0.0] * n
+    self.generation = 0
+    self.samples = {}
+
+  def getState(self):
+    state = Optimizer.getState(self)
+    del state['samples']
+    return state
+
+  def ask(self):
+    vectors = []
+    self.samples = {}
+    for _ in range(self.population):
+      z = [self.rng.gauss(0, 1) for _ in self.names]
+      x = [m + self.sigma * math.sqrt(c) * zi
+           for m, c, zi in zip(self.mean, self.variances, z)]
+      self.samples[id(x)] = z
+      vectors.append(x)
+    return vectors
+
+  def tell(self, vectors, scores):
+    ranked = self.record(vectors, scores)
+    n, mueff = len(self.names), self.mueff
+    zs = [self.samples[id(x)] for x in ranked[:len(self.weights)]]
+    ys = [[math.sqrt(c) * zi for c, zi in zip(self.variances, z)] for z in zs]
+    zw = [sum(w * z[i] for w, z in zip(self.weights, zs)) for i in range(n)]
+    yw = [sum(w * y[i] for w, y in zip(self.weights, ys)) for i in range(n)]
+
+    # Move the mean and update the evolution paths
+    self.mean = [m + self.sigma * y for m, y in zip(self.mean, yw)]
+    self.ps = [(1 - self.cs) * p + math.sqrt(self.cs * (2 - self.cs) * mueff) * z
+               for p, z in zip(self.ps, zw)]
+    self.generation += 1
+    norm = math.sqrt(sum(p * p for p in self.ps))
+    hs = norm / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) < \
+        (1.4 + 2.0 / (n + 1)) * self.chiN
+    self.pc = [(1 - self.cc) * p + hs * math.sqrt(self.cc * (2 - self.cc) * mueff) * y
+               for p, y in zip(self.pc, yw)]
+
+    # Adapt the variances and the step size
+    for i in range(n):
+      rankMu = sum(w * y[i] * y[i] for w, y in zip(self.weights, ys))
+      self.variances[i] = ((1 - self.c1 - self.cmu) * self.variances[i] +
+          self.c1 * (self.pc[i] ** 2 + (1 - hs) * self.cc * (2 - self.cc) *
+          self.variances[i]) + self.cmu * rankMu)
+    self.sigma *= math.exp(self.cs / self.ds * (norm / self.chiN - 1))
+
+class CrossEntropy(Optimizer):
+  """
+  Samples the population from a Gaussian with a diagonal covariance, then
+  moves the Gaussian towards the mean and spread of the best quarter of the
+  population (smoothed by alpha). The spread never falls below minSigma.
+  """
+  def __init__(self, initial, population, sigma=0.25, rng=random,
+               eliteFraction=0.25, alpha=0.7, minSigma=0.01):
+    Optimizer.__init__(self, initial, population, sigma, rng)
+    self.deviations = [sigma] * len(self.names)
+    self.numElite = max(2, int(population * eliteFraction))
+    self.alpha = alpha
+    self.minSigma = minSigma
+
+  def ask(self):
+    return [[self.rng.gauss(m, d) for m, d in zip(self.mean, self.deviations)]
+            for _ in range(self.population)]
+
+  def tell(self, vectors, scores):
+    elite = self.record(vectors, scores)[:self.numElite]
+    a = self.alpha
+    for i in range(len(self.names)):
+      values = [v[i] for v in elite]
+      average = sum(values) / len(values)
+      deviation = math.sqrt(sum((x - average) ** 2 for x in values) / len(values))
+      self.mean[i] = (1 - a) * self.mean[i] + a * average
+      self.deviations[i] = max(self.minSigma,
+                               (1 - a) * self.deviations[i] + a * deviation)
+
+OPTIMIZERS = {'genetic': Genetic, 'cmaes': CMAES, 'crossentropy': CrossEntropy}
+
+def loadWeights(path=WEIGHTS_FILE):
+  "Returns the offensive and defensive weights defined in path"
+  namespace = {}
+  execfile(path, namespace)
+  return namespace['offensive'], namespace['defensive']
+
+def formatWeights(name, weights):
+  "A line defining weights in the style of weights.py"
+  items = ','.join("'%s':%r" % (k, weights[k]) for k in sorted(weights))
+  return '%s={%s}' % (name, items)
+
+def writeWeights(name, weights, comment, path=WEIGHTS_FILE):
+  """
+  Comments out the current definition of name in path and adds weights below
+  it, preceded by comment, so that earlier weights are kept as history.
+  """
+  lines = open(path).read().split('\n')
+  for i, line in enumerate(lines):
+    if line.split('=')[0].strip() == name:
+      lines[i:i + 1] = ['#' + line, '', '# ' + comment, formatWeights(name, weights)]
+      break
+  else:
+    raise Exception('No definition of %s in %s' % (name, path))
+  out = open(path, 'w')
+  out.write('\n'.join(lines))
+  out.close()
+
+def evolve(optimizer, evaluator, generations, first=0, store=None, run=None):
+  """
+  Runs the optimizer from generation first until generations and returns its
+  best weights. Every generation is added to run in store, if given.
+  """
+  for generation in range(first, generations):
+    start = time.time()
+    vectors = optimizer.ask()
+    candidates = [optimizer.toWeights(v) for v in vectors]
+    scores = evaluator.evaluate(candidates)
+    optimizer.tell(vectors, scores)
+    if store is not None:
+      state = {'optimizer': optimizer.getState(), 'rng': optimizer.rng.getstate(),
+               'played': evaluator.played}
+      store.addGeneration(run, generation, candidates, scores, evaluator.results, state)
+
+    print 'Generation %d (%.1fs, %d games in all), best score so far: %.2f' % (
+        generation, time.time() - start, evaluator.played, optimizer.bestScore)
+    for i, (score, weights) in enumerate(zip(scores, candidates)):
+      print '%d - %.2f - %s' % (i, score, formatWeights(evaluator.train, weights))
+    sys.stdout.flush()
+  return optimizer.best
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  default = capture.default
+
+  parser.add_option('-o', '--optimizer', default='genetic',
+                    help=default('One of ' + ', '.join(sorted(OPTIMIZERS))))
+  parser.add_option('-g', '--generations', type='int', default=None,
+                    help='Number of generations [Default: %d, or that of a resumed run]' % GENERATIONS)
+  parser.add_option('-p', '--population', type='int', default=8,
+                    help=default('Number of candidates per generation'))
+  parser.add_option('-n', '--games', type='int', default=10,
+                    help=default('Games per candidate on each layout'))
+  parser.add_option('-l', '--layouts', default='contest03Capture',
+                    help=default('Comma separated LAYOUTS to play on'))
+  parser.add_option('--racing', action='store_true', default=False,
+                    help='Race the candidates, dropping bad ones after a few games')
+  parser.add_option('--keep', type='float', default=0.5,
+                    help=default('Fraction of the candidates kept by each round of a race'))
+  parser.add_option('--confidence', type='float', default=2.0,
+                    help=default('Standard errors by which a raced candidate must lose to be dropped'))
+  parser.add_option('-i', '--time', type='int', default=2000,
+                    help=default('TIME limit of a game in moves'))
+  parser.add_option('-t', '--train', default='offensive',
+                    help=default('The weights to tune: offensive or defensive'))
+  parser.add_option('-r', '--red', default='T',
+                    help=default('The team whose weights are tuned'))
+  parser.add_option('-b', '--blue', default='BaselineAgents',
+                    help=default('The team played against'))
+  parser.add_option('--redOpts', default="first={'depth':2}",
+                    help=default('Other options for the tuned team'))
+  parser.add_option('--blueOpts', default='',
+                    help=default('Options for the opponents'))
+  parser.add_option('-w', '--workers', type='int', default=0,
+                    help='Number of worker processes [Default: one per CPU]')
+  parser.add_option('--farm', default=None,
+                    help='Play the games on the farm coordinator at HOST:PORT (see farm.py)')
+  parser.add_option('--sigma', type='float', default=0.25,
+                    help=default('Initial step size, relative to the weights'))
+  parser.add_option('-s', '--seed', type='int', default=None,
+                    help='Seed of the random numbers')
+  parser.add_option('--weights', default=WEIGHTS_FILE,
+                    help=default('The weights file to read and write'))
+  parser.add_option('--dry', action='store_true', default=False,
+                    help='Do not write the best weights back')
+  parser.add_option('--store', default=None,
+                    help='Record the run in this experiment store (see experiments.py)')
+  parser.add_option('--resume', type='int', default=None,
+                    help='Resume this RUN of the store, with its own options')
+
+  options, otherjunk = parser.parse_args(argv)
+  if otherjunk:
+    raise Exception('Unrecognized options: ' + str(otherjunk))
+  if options.resume is not None and options.store is None:
+    raise Exception('Can only resume a run of an experiment store (--store)')
+  if options.optimizer not in OPTIMIZERS:
+    raise Exception('Unknown optimizer: ' + options.optimizer)
+  if options.population < 2:
+    raise Exception('The optimizers need a population of at least 2, not %d'
+                    % options.population)
+  if options.train not in ('offensive', 'defensive'):
+    raise Exception('Can only train offensive or defensive weights')
+  return options
+
+def runEvolution(options):
+  """
+  Tunes the weights as options say. With options.resume, the run is instead
+  continued from its last generation in the store, with its own options.
+  """
+  store, run, first, state = None, None, 0, None
+  if options.store is not None:
+    import experiments
+    store = experiments.ExperimentStore(options.store)
+    if options.resume is not None:
+      run = options.resume
+      stored, generation, state = store.getRun(run)
+      generations = options.generations or stored['generations']
+      options.__dict__.update(stored)
+      options.generations = generations
+      stored['generations'] = generations
+      store.setOptions(run, stored)
+      first = generation + 1
+      print 'Resuming run %d from generation %d' % (run, first)
+
+  if run is None:
+    options.generations = options.generations or GENERATIONS
+    offensive, defensive = loadWeights(options.weights)
+    options.initial, options.fixed = offensive, defensive
+    if options.train == 'defensive':
+      options.initial, options.fixed = defensive, offensive
+    if store is not None:
+      run = store.newRun(dict((k, v) for k, v in vars(options).items()
+                              if k not in ('store', 'resume')))
+      print 'Recording run %d in %s' % (run, options.store)
+
+  rng = random.Random(options.seed)
+  numWorkers = options.workers
+  if not numWorkers:
+    import multiprocessing
+    numWorkers = multiprocessing.cpu_count()
+  args = (options.train, options.fixed, options.layouts.split(','), options.games,
+      options.time, options.red, capture.parseAgentArgs(options.redOpts),
+      options.blue, capture.parseAgentArgs(options.blueOpts), numWorkers, rng,
+      options.farm)
+  if options.racing:
+    evaluator = RacingEvaluator(keep=options.keep,
+                                confidence=options.confidence, *args)
+  else:
+    evaluator = Evaluator(*args)
+  optimizer = OPTIMIZERS[options.optimizer](options.initial, options.population,
+      options.sigma, rng)
+  if state is not None:
+    optimizer.setState(state['optimizer'])
+    version, internal, gauss = state['rng']
+    rng.setstate((version, tuple(internal), gauss))
+    evaluator.played = state['played']
+
+  try:
+    best = evolve(optimizer, evaluator, options.generations, first, store, run)
+  finally:
+    evaluator.close()
+    if store is not None:
+      store.close()
+
+  print 'Best score: %.2f' % optimizer.bestScore
+  print formatWeights(options.train, best)
+  if not options.dry:
+    comment = 'Tuned by evolve.py (%s, %d generations of %d), mean score %.2f' % (
+        options.optimizer, options.generations, options.population, optimizer.bestScore)
+    writeWeights(options.train, best, comment, options.weights)
+
+if __name__ == '__main__':
+  runEvolution(readCommand(sys.argv[1:]))
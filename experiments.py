@@ -0,0 +1,198 @@
+# experiments.py
+# --------------
+# A store of weight tuning runs, replacing the growth* logs.
+
+"""
+Keeps the history of the runs of evolve.py in a SQLite database: the options
+of every run, and for every generation its candidates (weights and scores),
+the games each of them played (layout, seed, score, wall-clock time and the
+time used by every agent) and the state of the optimizer, so that an
+interrupted run can be resumed after its last complete generation.
+
+Run as a program, it reports on the runs in a database without playing any
+game: a list of the runs, or the learning curve and best weights of one.
+
+USAGE: python experiments.py -d tuning.db [-r RUN] [-n BEST]
+"""
+
+import sys
+import json
+import sqlite3
+import time
+
+DATABASE = 'tuning.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+  id INTEGER PRIMARY KEY,
+  started REAL,
+  optimizer TEXT,
+  train TEXT,
+  options TEXT,
+  generation INTEGER,
+  state TEXT
+);
+CREATE TABLE IF NOT EXISTS candidates (
+  id INTEGER PRIMARY KEY,
+  run INTEGER REFERENCES runs(id),
+  generation INTEGER,
+  position INTEGER,
+  weights TEXT,
+  score REAL,
+  games INTEGER,
+  seconds REAL
+);
+CREATE TABLE IF NOT EXISTS games (
+  id INTEGER PRIMARY KEY,
+  candidate INTEGER REFERENCES candidates(id),
+  layout TEXT,
+  seed INTEGER,
+  score REAL,
+  seconds REAL,
+  agentTimes TEXT,
+  warnings TEXT
+);
+CREATE INDEX IF NOT EXISTS candidatesByGeneration ON candidates (run, generation);
+CREATE INDEX IF NOT EXISTS candidatesByScore ON candidates (run, score);
+CREATE INDEX IF NOT EXISTS gamesByCandidate ON games (candidate);
+CREATE INDEX IF NOT EXISTS gamesByLayout ON games (layout, seed);
+'''
+
+class ExperimentStore:
+  """
+  The runs kept in the database at path. A generation is written in a single
+  transaction, together with the state needed to go on from it, so a run
+  that is interrupted can always be resumed from its last stored generation.
+  """
+  def __init__(self, path=DATABASE):
+    self.connection = sqlite3.connect(path)
+    self.connection.executescript(SCHEMA)
+
+  def newRun(self, options):
+    "Adds a run with options (a dict) and returns its id"
+    with self.connection:
+      cursor = self.connection.execute(
+          'INSERT INTO runs (started, optimizer, train, options, generation) '
+          'VALUES (?, ?, ?, ?, -1)', (time.time(), options['optimizer'],
+          options['train'], json.dumps(options)))
+    return cursor.lastrowid
+
+  def setOptions(self, run, options):
+    "Replaces the options of run, such as when it is extended"
+    with self.connection:
+      self.connection.execute('UPDATE runs SET options = ? WHERE id = ?',
+                              (json.dumps(options), run))
+
+  def getRun(self, run):
+    """
+    The options of run, its last stored generation and the state stored with
+    it (None before the first generation)
+    """
+    row = self.connection.execute(
+        'SELECT options, generation, state FROM runs WHERE id = ?', (run,)).fetchone()
+    if row is None:
+      raise Exception('No run %d in the experiment store' % run)
+    options, generation, state = row
+    return json.loads(options), generation, state and json.loads(state)
+
+  def addGeneration(self, run, generation, candidates, scores, results, state):
+    """
+    Stores a generation of run: the weights of candidates, their scores, the
+    games they played (results, a list of (layout, seed, score, seconds,
+    agentTimes, warnings) for every candidate) and the state to resume from.
+    """
+    with self.connection:
+      for position, (weights, score, games) in enumerate(zip(candidates, scores, results)):
+        cursor = self.connection.execute(
+            'INSERT INTO candidates (run, generation, position, weights, score, '
+            'games, seconds) VALUES (?, ?, ?, ?, ?, ?, ?)', (run, generation,
+            position, json.dumps(weights, sort_keys=True), score, len(games),
+            sum(g[3] for g in games)))
+        self.connection.executemany(
+            'INSERT INTO games (candidate, layout, seed, score, seconds, '
+            'agentTimes, warnings) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(cursor.lastrowid, layout, seed, score, seconds, json.dumps(times),
+              json.dumps(warnings)) for layout, seed, score, seconds, times,
+             warnings in games])
+      self.connection.execute('UPDATE runs SET generation = ?, state = ? WHERE id = ?',
+                              (generation, json.dumps(state), run))
+
+  def getRuns(self):
+    "(id, started, optimizer, train, generations, best score) of every run"
+    return self.connection.execute(
+        'SELECT runs.id, started, optimizer, train, runs.generation + 1, MAX(score) '
+        'FROM runs LEFT JOIN candidates ON candidates.run = runs.id '
+        'GROUP BY runs.id ORDER BY runs.id').fetchall()
+
+  def getCurve(self, run):
+    "(generation, best score, mean score, games, seconds) of every generation of run"
+    return self.connection.execute(
+        'SELECT generation, MAX(score), AVG(score), SUM(games), SUM(seconds) '
+        'FROM candidates WHERE run = ? GROUP BY generation ORDER BY generation',
+        (run,)).fetchall()
+
+  def getBest(self, run, count=1):
+    "(generation, score, games, weights) of the count best candidates of run"
+    rows = self.connection.execute(
+        'SELECT generation, score, games, weights FROM candidates WHERE run = ? '
+        'ORDER BY score DESC, games DESC LIMIT ?', (run, count)).fetchall()
+    return [(g, s, n, json.loads(w)) for g, s, n, w in rows]
+
+  def getAgentTimes(self, run):
+    "The mean time per game used by every agent in the games of run"
+    totals, count = [], 0
+    for (times,) in self.connection.execute(
+        'SELECT agentTimes FROM games JOIN candidates ON games.candidate = candidates.id '
+        'WHERE run = ?', (run,)):
+      times = json.loads(times)
+      totals = [a + b for a, b in zip(totals, times)] if totals else times
+      count += 1
+    return [t / count for t in totals]
+
+  def close(self):
+    self.connection.close()
+
+def report(store, run=None, count=3):
+  "Prints the runs in store, or the learning curve and best weights of run"
+  from evolve import formatWeights
+  if run is None:
+    print 'run  started           optimizer     train      generations  best'
+    for id, started, optimizer, train, generations, best in store.getRuns():
+      print '%-4d %s  %-13s %-10s %11d  %s' % (id, time.strftime('%Y-%m-%d %H:%M',
+          time.localtime(started)), optimizer, train, generations,
+          '%.2f' % best if best is not None else '-')
+    return
+
+  options, generation, state = store.getRun(run)
+  print 'Run %d: %s' % (run, ' '.join('%s=%s' % (k, v) for k, v in
+                                      sorted(options.items()) if k not in ('initial', 'fixed')))
+  print 'generation  best     mean     games  seconds'
+  for generation, best, average, games, seconds in store.getCurve(run):
+    print '%10d  %-7.2f  %-7.2f  %5d  %7.1f' % (generation, best, average, games, seconds)
+  times = store.getAgentTimes(run)
+  if times:
+    print 'Mean time per game by agent: ' + ', '.join('%d: %.1fs' % item
+                                                       for item in enumerate(times))
+  print 'Best weights:'
+  for generation, score, games, weights in store.getBest(run, count):
+    print '%.2f (generation %d, %d games) %s' % (score, generation, games,
+                                                 formatWeights(options['train'], weights))
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('-d', '--database', default=DATABASE,
+                    help='The experiment store [Default: %default]')
+  parser.add_option('-r', '--run', type='int', default=None,
+                    help='The run to report on [Default: list the runs]')
+  parser.add_option('-n', '--best', type='int', default=3,
+                    help='Number of best weights to list [Default: %default]')
+  options, otherjunk = parser.parse_args(argv)
+  if otherjunk:
+    raise Exception('Unrecognized options: ' + str(otherjunk))
+  return options
+
+if __name__ == '__main__':
+  options = readCommand(sys.argv[1:])
+  report(ExperimentStore(options.database), options.run, options.best)
@@ -0,0 +1,365 @@
+# farm.py
+# -------
+# Plays games on worker processes, on this host or others, for a coordinator.
+
+"""
+A coordinator hands out games to workers over TCP and collects their results.
+Clients (such as evolve.py --farm) submit games and wait for their results.
+The messages are JSON objects, one per line. A game is given as the task of
+evolve.playGame, and its result is what playGame returns.
+
+A worker asks for a game, plays it and sends back the result. While playing,
+it sends a heartbeat every few seconds. A game is put back in the queue if its
+worker disconnects or stops sending heartbeats, and it fails after a number
+of attempts.
+
+Commands:
+  python farm.py coordinator [-p PORT]       runs the coordinator
+  python farm.py worker [-a HOST:PORT]       runs a worker
+  python farm.py status [-a HOST:PORT]       prints the queue and throughput
+  python farm.py local [-n WORKERS]          runs a coordinator and workers here
+
+For instance, python farm.py local -n 3 stands in for three hosts, and
+python evolve.py --farm localhost:7226 plays its games on them.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import collections
+import SocketServer
+
+PORT = 7226
+HEARTBEAT = 5.0
+
+def send(stream, message, lock=None):
+  "Writes message as a line of JSON to a file made by socket.makefile"
+  line = json.dumps(message) + '\n'
+  if lock is not None:
+    with lock:
+      stream.write(line)
+      stream.flush()
+  else:
+    stream.write(line)
+    stream.flush()
+
+def receive(stream):
+  "Reads a message, or returns None if the connection was closed"
+  line = stream.readline()
+  if not line:
+    return None
+  return json.loads(line)
+
+def parseAddress(address):
+  host, _, port = address.rpartition(':')
+  return host or 'localhost', int(port)
+
+class JobQueue:
+  """
+  The games of the coordinator, by id. A game is queued, running (on a
+  worker, which must send heartbeats), done or failed. Every method holds
+  the lock, and waiting callers are woken up by self.changed whenever a game
+  is queued or finishes.
+  """
+  def __init__(self, timeout=4 * HEARTBEAT, maxAttempts=3):
+    self.timeout = timeout
+    self.maxAttempts = maxAttempts
+    self.jobs = {}
+    self.queue = collections.deque()
+    self.workers = {}
+    self.finished = collections.deque()
+    self.started = time.time()
+    self.lock = threading.Lock()
+    self.changed = threading.Condition(self.lock)
+
+  def submit(self, tasks):
+    "Queues tasks and returns their ids"
+    with self.lock:
+      ids = []
+      for task in tasks:
+        id = len(self.jobs)
+        self.jobs[id] = {'task': task, 'state': 'queued', 'attempts': 0,
+                         'worker': None, 'heartbeat': None, 'result': None}
+        self.queue.append(id)
+        ids.append(id)
+      self.changed.notifyAll()
+      return ids
+
+  def take(self, worker, wait=1.0):
+    "Gives the next queued game to worker, waiting up to wait for one"
+    with self.lock:
+      self.workers.setdefault(worker, {'job': None, 'done': 0})
+      if not self.queue:
+        self.changed.wait(wait)
+      if not self.queue:
+        return None, None
+      id = self.queue.popleft()
+      job = self.jobs[id]
+      job['state'], job['worker'], job['heartbeat'] = 'running', worker, time.time()
+      job['attempts'] += 1
+      self.workers[worker]['job'] = id
+      return id, job['task']
+
+  def heartbeat(self, id):
+    with self.lock:
+      self.jobs[id]['heartbeat'] = time.time()
+
+  def finish(self, id, result, worker):
+    """
+    Records the result of a game played by worker. A game that was requeued
+    can be finished by any of the workers that took it, whichever is first,
+    even while it waits in the queue again. The results of a game that is
+    done or has failed are dropped.
+    """
+    with self.lock:
+      job = self.jobs[id]
+      if job['state'] == 'queued':
+        self.queue.remove(id)
+      elif job['state'] != 'running':
+        return
+      job['state'], job['result'] = 'done', result
+      if job['worker'] in self.workers and self.workers[job['worker']]['job'] == id:
+        self.workers[job['worker']]['job'] = None
+      if worker in self.workers:
+        self.workers[worker]['done'] += 1
+      self.finished.append(time.time())
+      self.changed.notifyAll()
+
+  def requeue(self, id):
+    "Puts a game that did not finish back in the queue, or fails it"
+    job = self.jobs[id]
+    if job['state'] != 'running':
+      return
+    if job['worker'] in self.workers:
+      self.workers[job['worker']]['job'] = None
+    if job['attempts'] >= self.maxAttempts:
+      job['state'] = 'failed'
+    else:
+      job['state'] = 'queued'
+      self.queue.appendleft(id)
+    self.changed.notifyAll()
+
+  def leave(self, worker):
+    "Requeues the game of a worker that disconnected"
+    with self.lock:
+      state = self.workers.pop(worker, None)
+      if state is not None and state['job'] is not None:
+        self.requeue(state['job'])
+
+  def reap(self):
+    "Requeues the games whose workers stopped sending heartbeats"
+    with self.lock:
+      now = time.time()
+      for id, job in self.jobs.items():
+        if job['state'] == 'running' and now - job['heartbeat'] > self.timeout:
+          self.requeue(id)
+
+  def wait(self, ids):
+    "Waits until the games ids are done or failed and returns their results"
+    with self.lock:
+      while any(self.jobs[id]['state'] in ('queued', 'running') for id in ids):
+        self.changed.wait(1.0)
+      return [self.jobs[id]['result'] for id in ids]
+
+  def getStatus(self):
+    with self.lock:
+      now = time.time()
+      while self.finished and now - self.finished[0] > 60:
+        self.finished.popleft()
+      counts = collections.Counter(job['state'] for job in self.jobs.values())
+      return {'queued': counts['queued'], 'running': counts['running'],
+              'done': counts['done'], 'failed': counts['failed'],
+              'lastMinute': len(self.finished),
+              'perMinute': 60.0 * counts['done'] / max(1.0, now - self.started),
+              'workers': dict((name, dict(worker))
+                              for name, worker in self.workers.items())}
+
+class Handler(SocketServer.StreamRequestHandler):
+  "Serves the messages of one connection, from a worker or a client"
+  def handle(self):
+    jobs = self.server.jobs
+    worker = None
+    try:
+      while True:
+        message = receive(self.rfile)
+        if message is None:
+          break
+        kind = message['type']
+        if kind == 'take':
+          worker = message['worker']
+          id, task = jobs.take(worker)
+          send(self.wfile, {'type': 'job', 'job': id, 'task': task})
+        elif kind == 'heartbeat':
+          jobs.heartbeat(message['job'])
+        elif kind == 'result':
+          jobs.finish(message['job'], message['result'], worker)
+        elif kind == 'submit':
+          send(self.wfile, {'type': 'submitted', 'jobs': jobs.submit(message['tasks'])})
+        elif kind == 'wait':
+          send(self.wfile, {'type': 'results', 'results': jobs.wait(message['jobs'])})
+        elif kind == 'status':
+          send(self.wfile, dict(jobs.getStatus(), type='status'))
+        else:
+          send(self.wfile, {'type': 'error', 'message': 'Unknown message ' + kind})
+    except socket.error:
+      pass
+    finally:
+      if worker is not None:
+        jobs.leave(worker)
+
+class Coordinator(SocketServer.ThreadingTCPServer):
+  "The coordinator, with a thread that requeues the games of silent workers"
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, port=PORT, host=''):
+    SocketServer.ThreadingTCPServer.__init__(self, (host, port), Handler)
+    self.jobs = JobQueue()
+    reaper = threading.Thread(target=self.reapForever)
+    reaper.daemon = True
+    reaper.start()
+
+  def reapForever(self):
+    while True:
+      time.sleep(HEARTBEAT)
+      self.jobs.reap()
+
+def connect(address):
+  "A connected socket and its file, to the coordinator at address"
+  connection = socket.create_connection(parseAddress(address))
+  return connection, connection.makefile('rw')
+
+def runWorker(address, name=None):
+  """
+  Plays the games of the coordinator at address until it goes away. The game
+  is played in this thread (the time limits of capture.py use signals), and a
+  second thread sends the heartbeats.
+  """
+  from evolve import playGame
+  name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+  connection, stream = connect(address)
+  lock = threading.Lock()
+  current = [None]
+
+  def beat():
+    while True:
+      time.sleep(HEARTBEAT)
+      if current[0] is not None:
+        try:
+          send(stream, {'type': 'heartbeat', 'job': current[0]}, lock)
+        except socket.error:
+          return
+  heart = threading.Thread(target=beat)
+  heart.daemon = True
+  heart.start()
+
+  try:
+    while True:
+      send(stream, {'type': 'take', 'worker': name}, lock)
+      message = receive(stream)
+      if message is None:
+        break
+      if message['task'] is None:
+        continue
+      current[0] = message['job']
+      result = playGame(message['task'])
+      current[0] = None
+      send(stream, {'type': 'result', 'job': message['job'], 'result': result}, lock)
+  except socket.error:
+    pass
+  connection.close()
+
+class FarmPool:
+  """
+  Plays games on the workers of the coordinator at address instead of a
+  multiprocessing.Pool, for evolve.py. Only evolve.playGame can be mapped.
+  """
+  def __init__(self, address):
+    self.connection, self.stream = connect(address)
+
+  def map(self, function, tasks):
+    if function.__name__ != 'playGame':
+      raise ValueError('Farm workers only play games (evolve.playGame)')
+    send(self.stream, {'type': 'submit', 'tasks': tasks})
+    ids = receive(self.stream)['jobs']
+    send(self.stream, {'type': 'wait', 'jobs': ids})
+    results = receive(self.stream)['results']
+    if None in results:
+      raise Exception('%d games failed on the farm' % results.count(None))
+    return [tuple(result) for result in results]
+
+  def terminate(self):
+    self.connection.close()
+
+def getStatus(address):
+  connection, stream = connect(address)
+  send(stream, {'type': 'status'})
+  status = receive(stream)
+  connection.close()
+  return status
+
+def formatStatus(status):
+  lines = ['queued: %(queued)d, running: %(running)d, done: %(done)d, '
+           'failed: %(failed)d' % status,
+           'throughput: %(lastMinute)d games in the last minute, '
+           '%(perMinute).1f per minute overall' % status,
+           '%d workers:' % len(status['workers'])]
+  for name, worker in sorted(status['workers'].items()):
+    job = 'idle' if worker['job'] is None else 'game %d' % worker['job']
+    lines.append('  %-30s %-12s %d done' % (name, job, worker['done']))
+  return '\n'.join(lines)
+
+def runLocal(numWorkers, port=PORT):
+  """
+  Runs a coordinator in this process and numWorkers worker processes, which
+  stand in for the hosts of a farm, until interrupted
+  """
+  import multiprocessing
+  coordinator = Coordinator(port, 'localhost')
+  server = threading.Thread(target=coordinator.serve_forever)
+  server.daemon = True
+  server.start()
+  address = 'localhost:%d' % port
+  workers = [multiprocessing.Process(target=runWorker, args=(address,))
+             for _ in range(numWorkers)]
+  for worker in workers:
+    worker.daemon = True
+    worker.start()
+  print 'Coordinator on %s with %d local workers' % (address, numWorkers)
+  try:
+    while True:
+      time.sleep(60)
+      print formatStatus(coordinator.jobs.getStatus())
+      sys.stdout.flush()
+  except KeyboardInterrupt:
+    pass
+  coordinator.shutdown()
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('-a', '--address', default='localhost:%d' % PORT,
+                    help='The address of the coordinator [Default: %default]')
+  parser.add_option('-p', '--port', type='int', default=PORT,
+                    help='The port the coordinator listens on [Default: %default]')
+  parser.add_option('-n', '--workers', type='int', default=2,
+                    help='Number of local workers [Default: %default]')
+  options, args = parser.parse_args(argv)
+  if len(args) != 1 or args[0] not in ('coordinator', 'worker', 'status', 'local'):
+    parser.error('Give one of the commands coordinator, worker, status or local')
+  return args[0], options
+
+if __name__ == '__main__':
+  command, options = readCommand(sys.argv[1:])
+  if command == 'coordinator':
+    Coordinator(options.port).serve_forever()
+  elif command == 'worker':
+    runWorker(options.address)
+  elif command == 'status':
+    print formatStatus(getStatus(options.address))
+  else:
+    runLocal(options.workers, options.port)
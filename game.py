@@ -503,10 +503,29 @@ class Game:
     self.catchExceptions = catchExceptions
     self.moveHistory = []
     self.totalAgentTimes = [0 for agent in agents]
+    self.maxAgentTimes = [0 for agent in agents]
     self.totalAgentTimeWarnings = [0 for agent in agents]
     self.agentTimeout = False
+    self.crashedAgent = None
     import cStringIO
     self.agentOutput = [cStringIO.StringIO() for agent in agents]
+    self.seed = None
+    self.streams = None
+    self.recorder = None
+
+  def setSeed(self, seed, streams):
+    "Draws the random numbers of the game from streams (util.RandomStreams)"
+    self.seed = seed
+    self.streams = streams
+
+  def setRecorder(self, recorder):
+    """
+    Writes the game as it is played with recorder (such as a live
+    replay.ReplayWriter): recorder.start(state) is called with the first
+    state, recorder.addMove(agentIndex, action, state) after every move and
+    recorder.end(game) when the game stops, whether it is over or not.
+    """
+    self.recorder = recorder
 
   def getProgress(self):
     if self.gameOver:
@@ -519,12 +538,19 @@ class Game:
     if not quiet: traceback.print_exc()
     self.gameOver = True
     self.agentCrashed = True
+    self.crashedAgent = agentIndex
     self.rules.agentCrash(self, agentIndex)
 
+  def recordMoveTime(self, agentIndex, moveTime):
+    self.totalAgentTimes[agentIndex] += moveTime
+    self.maxAgentTimes[agentIndex] = max(self.maxAgentTimes[agentIndex], moveTime)
+
   OLD_STDOUT = None
   OLD_STDERR = None
 
   def mute(self, agentIndex):
+    # Every call to an agent is surrounded by mute and unmute
+    if self.streams is not None: self.streams.enterAgent(agentIndex)
     if not self.muteAgents: return
     global OLD_STDOUT, OLD_STDERR
     import cStringIO
@@ -534,6 +560,7 @@ class Game:
     sys.stderr = self.agentOutput[agentIndex]
 
   def unmute(self):
+    if self.streams is not None: self.streams.leaveAgent()
     if not self.muteAgents: return
     global OLD_STDOUT, OLD_STDERR
     # Revert stdout/stderr to originals
@@ -545,6 +572,15 @@ class Game:
     """
     Main control loop for game play.
     """
+    if self.recorder is None:
+      return self.play()
+    self.recorder.start(self.state)
+    try:
+      self.play()
+    finally:
+      self.recorder.end(self)
+
+  def play( self ):
     self.display.initialize(self.state.data)
     self.numMoves = 0
 
@@ -645,7 +681,7 @@ class Game:
               self._agentCrash(agentIndex, quiet=True)
               self.unmute()
 
-          self.totalAgentTimes[agentIndex] += move_time
+          self.recordMoveTime(agentIndex, move_time)
           #print "Agent: %d, time: %f, total: %f" % (agentIndex, move_time, self.totalAgentTimes[agentIndex])
           if self.totalAgentTimes[agentIndex] > self.rules.getMaxTotalTime(agentIndex):
             print "Agent %d ran out of time! (time: %1.2f)" % (agentIndex, self.totalAgentTimes[agentIndex])
@@ -659,7 +695,9 @@ class Game:
           self.unmute()
           return
       else:
+        start_time = time.time()
         action = agent.getAction(observation)
+        self.recordMoveTime(agentIndex, time.time() - start_time)
       self.unmute()
 
       # Execute the action
@@ -674,6 +712,8 @@ class Game:
           return
       else:
         self.state = self.state.generateSuccessor( agentIndex, action )
+      if self.recorder is not None:
+        self.recorder.addMove( agentIndex, action, self.state )
 
       # Change the display
       self.display.update( self.state.data )
@@ -0,0 +1,250 @@
+# league.py
+# ---------
+# Plays a league between the teams under teams/, with Elo ratings.
+
+"""
+Plays every team package under teams/ (those with a config.py) against each
+other on the capture layouts, in a pool of worker processes. Every pairing
+plays each layout twice, once in each colour. The pairings are either a
+round robin, in which every team meets every other, or a number of Swiss
+rounds, in which teams of similar rating are paired without rematches.
+
+The Elo ratings are updated as the results come in, and the standings are
+written to a file after every game, so that they can be followed while the
+league runs and are kept if it is interrupted. A team whose agents cannot be
+loaded (its package fails to import, say) is left out of the league.
+
+USAGE: python league.py -f swiss -r 5 -l contest03Capture,defaultCapture -w 4
+"""
+
+import os
+import sys
+import glob
+import itertools
+import traceback
+
+import util
+import capture
+from evolve import playGame
+
+TEAMS_DIRECTORY = 'teams'
+
+def findTeams(directory=TEAMS_DIRECTORY):
+  "The names of the team packages in directory"
+  return sorted(name for name in os.listdir(directory)
+                if os.path.exists(os.path.join(directory, name, 'config.py')))
+
+def canLoad(team):
+  "Whether the agents of team can be loaded, as the games will load them"
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    agents = capture.loadAgents(True, team, True, {})
+  except Exception:
+    traceback.print_exc()
+    agents = [None]
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+  return None not in agents
+
+def findLayouts(directory='layouts'):
+  "The names of the capture layouts in directory"
+  return sorted(os.path.basename(path)[:-len('.lay')]
+                for path in glob.glob(os.path.join(directory, '*Capture.lay')))
+
+class Ratings:
+  """
+  The Elo ratings of the teams, with their record. A game counts as a win
+  (1), a tie (0.5) or a loss (0) whatever the margin, and moves the ratings
+  of both teams by k times the difference with the expected result.
+  """
+  def __init__(self, teams, k=16.0, initial=1500.0):
+    self.k = k
+    self.ratings = dict((team, initial) for team in teams)
+    self.records = dict((team, [0, 0, 0]) for team in teams)
+    self.opponents = dict((team, set()) for team in teams)
+
+  def getExpected(self, team, opponent):
+    "The expected result of team against opponent"
+    return 1.0 / (1 + 10 ** ((self.ratings[opponent] - self.ratings[team]) / 400.0))
+
+  def update(self, red, blue, score):
+    "Records a game between red and blue that ended with score"
+    result = 1.0 if score > 0 else 0.5 if score == 0 else 0.0
+    change = self.k * (result - self.getExpected(red, blue))
+    self.ratings[red] += change
+    self.ratings[blue] -= change
+    outcome = 0 if score > 0 else 1 if score == 0 else 2
+    self.records[red][outcome] += 1
+    self.records[blue][2 - outcome] += 1
+    self.opponents[red].add(blue)
+    self.opponents[blue].add(red)
+
+  def getStandings(self):
+    "The teams from the highest rated to the lowest"
+    return sorted(self.ratings, key=lambda team: (-self.ratings[team], team))
+
+  def __str__(self):
+    lines = ['rank  team                  rating  games   won  tied  lost']
+    for rank, team in enumerate(self.getStandings()):
+      won, tied, lost = self.records[team]
+      lines.append('%4d  %-20s  %6.1f  %5d  %4d  %4d  %4d' % (rank + 1, team,
+                   self.ratings[team], won + tied + lost, won, tied, lost))
+    return '\n'.join(lines)
+
+  def write(self, path):
+    "Writes the standings to path, replacing it only once they are complete"
+    temporary = path + '.tmp'
+    out = open(temporary, 'w')
+    out.write(str(self) + '\n')
+    out.close()
+    os.rename(temporary, path)
+
+def roundRobin(teams):
+  "Every pairing of two teams"
+  return list(itertools.combinations(teams, 2))
+
+def swissPairings(ratings):
+  """
+  Pairs the teams in order of rating, each with the next highest rated team
+  it has not met yet (or, failing that, the next one). With an odd number of
+  teams, the lowest rated team left sits the round out.
+  """
+  unpaired = ratings.getStandings()
+  pairings = []
+  while len(unpaired) > 1:
+    team = unpaired.pop(0)
+    fresh = [other for other in unpaired if other not in ratings.opponents[team]]
+    opponent = (fresh or unpaired)[0]
+    unpaired.remove(opponent)
+    pairings.append((team, opponent))
+  return pairings
+
+def getGames(pairings, layouts, length, seed, round=0):
+  "The games of pairings on every layout, with colours swapped, as tasks of playGame"
+  games = []
+  for first, second in pairings:
+    for name in layouts:
+      for red, blue in ((first, second), (second, first)):
+        gameSeed = util.deriveSeed(seed, round, red, blue, name)
+        games.append((red, {}, blue, {}, name, length, gameSeed))
+  return games
+
+def playMatch(task):
+  "Plays a game of the league and returns it with its result"
+  return task, playGame(task)
+
+class League:
+  """
+  Plays the games of a league, in numWorkers processes, and keeps the
+  ratings up to date as the results come in, in whatever order they do.
+  """
+  def __init__(self, teams, layouts, length, numWorkers=1, seed=0, k=16.0,
+               output=None):
+    self.teams = teams
+    self.layouts = layouts
+    self.length = length
+    self.seed = seed
+    self.ratings = Ratings(teams, k)
+    self.output = output
+    self.played = 0
+    self.pool = None
+    if numWorkers > 1:
+      import multiprocessing
+      self.pool = multiprocessing.Pool(numWorkers)
+
+  def play(self, games):
+    "Plays games, updating the ratings and standings after each"
+    if self.pool is not None:
+      results = self.pool.imap_unordered(playMatch, games)
+    else:
+      results = itertools.imap(playMatch, games)
+    for (red, _, blue, _, name, _, seed), result in results:
+      score = result[0]
+      self.ratings.update(red, blue, score)
+      self.played += 1
+      print '%d/%d: %s (red) vs %s (blue) on %s, seed %d: %d' % (self.played,
+          self.total, red, blue, name, seed, score)
+      sys.stdout.flush()
+      if self.output is not None:
+        self.ratings.write(self.output)
+
+  def playRoundRobin(self):
+    games = getGames(roundRobin(self.teams), self.layouts, self.length,
+                     self.seed)
+    self.total = len(games)
+    self.play(games)
+
+  def playSwiss(self, rounds):
+    self.total = rounds * (len(self.teams) / 2) * len(self.layouts) * 2
+    for round in range(rounds):
+      pairings = swissPairings(self.ratings)
+      print 'Round %d: %s' % (round + 1, ', '.join('%s vs %s' % pair
+                                                   for pair in pairings))
+      self.play(getGames(pairings, self.layouts, self.length, self.seed, round))
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool = None
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  default = capture.default
+
+  parser.add_option('-t', '--teams', default=None,
+                    help='Comma separated teams to play [Default: all those under teams/]')
+  parser.add_option('-l', '--layouts', default=None,
+                    help='Comma separated layouts to play on [Default: all the capture layouts]')
+  parser.add_option('-f', '--format', default='roundrobin',
+                    help=default('roundrobin or swiss'))
+  parser.add_option('-r', '--rounds', type='int', default=5,
+                    help=default('Number of Swiss rounds'))
+  parser.add_option('-i', '--time', type='int', default=1200,
+                    help=default('TIME limit of a game in moves'))
+  parser.add_option('-k', type='float', default=16.0,
+                    help=default('The K factor of the Elo ratings'))
+  parser.add_option('-w', '--workers', type='int', default=0,
+                    help='Number of worker processes [Default: one per CPU]')
+  parser.add_option('-s', '--seed', type='int', default=0,
+                    help=default('Seed of the games'))
+  parser.add_option('-o', '--output', default='standings.txt',
+                    help=default('The file the standings are written to'))
+
+  options, otherjunk = parser.parse_args(argv)
+  if otherjunk:
+    raise Exception('Unrecognized options: ' + str(otherjunk))
+  if options.format not in ('roundrobin', 'swiss'):
+    raise Exception('Unknown league format: ' + options.format)
+  return options
+
+def runLeague(options):
+  teams = options.teams.split(',') if options.teams else findTeams()
+  layouts = options.layouts.split(',') if options.layouts else findLayouts()
+  for team in [team for team in teams if not canLoad(team)]:
+    print 'Leaving out team %s: its agents could not be loaded' % team
+    teams.remove(team)
+  if len(teams) < 2:
+    raise Exception('A league needs at least two teams')
+  numWorkers = options.workers
+  if not numWorkers:
+    import multiprocessing
+    numWorkers = multiprocessing.cpu_count()
+
+  print 'League of %s on %d layouts' % (', '.join(teams), len(layouts))
+  league = League(teams, layouts, options.time, numWorkers, options.seed,
+                  options.k, options.output)
+  try:
+    if options.format == 'swiss':
+      league.playSwiss(options.rounds)
+    else:
+      league.playRoundRobin()
+  finally:
+    league.close()
+  print league.ratings
+
+if __name__ == '__main__':
+  runLeague(readCommand(sys.argv[1:]))
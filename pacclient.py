@@ -35,7 +35,7 @@ def secs():
 
 class TeamThread(threading.Thread):
 
-  def __init__(self, agents, pacClient):
+  def __init__(self, agents, pacClient, ponder=False):
     threading.Thread.__init__(self)
     self.gotGameStateEvent = threading.Event()
     self.gameState = None # Slot filled by PacClient
@@ -47,6 +47,7 @@ class TeamThread(threading.Thread):
     self.gameOver = False
     self.pacClient = pacClient  # For sending actions
     self.rules = CaptureRules()
+    self.ponder = ponder # Think while the other agents move
     self.setDaemon(True)
 
   def run(self):
@@ -76,9 +77,14 @@ class TeamThread(threading.Thread):
       debugl(action)
       self.pacClient.sendAction(localMoveNumber, action)
 
+      # Until the next state arrives, let the agent think ahead. It must
+      # return as soon as the event is set, so real moves are not delayed.
+      if self.ponder and 'ponder' in dir(agent):
+        agent.ponder(localGS, action, self.gotGameStateEvent)
+
 class PacClient(asyncore.dispatcher):
 
-  def __init__(self, server, port, agentFactoryBuilder, display, user, password, gamename):
+  def __init__(self, server, port, agentFactoryBuilder, display, user, password, gamename, ponder=False):
     asyncore.dispatcher.__init__(self)
     self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
     print >>sys.stderr, "Connecting to server(%s:%d)..." % (server, port)
@@ -117,6 +123,7 @@ class PacClient(asyncore.dispatcher):
     else:
       self.anygame = True
       self.gamename = False
+    self.ponder = ponder
     self.teamThread = None # Created on launch of game
     asyncore.loop()
 
@@ -222,7 +229,7 @@ class PacClient(asyncore.dispatcher):
     for agent in self.agents:
       if 'registerTeam' in dir(agent):
         agent.registerTeam(self.agents)
-    self.teamThread = TeamThread(self.agents, self)
+    self.teamThread = TeamThread(self.agents, self, self.ponder)
     self.teamThread.gotTimeout = False
     self.teamThread.daemon = True
     self.teamThread.start()
@@ -345,6 +352,8 @@ def readCommand( argv ):
                     help=default('The name of the game you wish to contact'), default='')
   parser.add_option('-f', '--fixRandomSeed', action='store_true',
                     help='Fixes the random seed to always play the same game', default=False)
+  parser.add_option('--ponder', action='store_true',
+                    help='Let agents think while the other agents move', default=False)
 
   options, otherjunk = parser.parse_args()
   if len(otherjunk) != 0: raise Exception("Illegal args: " + otherjunk)
@@ -374,6 +383,7 @@ def readCommand( argv ):
   args['user'] = options.user
   args['password'] = options.password
   args['gamename'] = options.gamename
+  args['ponder'] = options.ponder
 
   return args
 
@@ -0,0 +1,346 @@
+# replay.py
+# ---------
+# A compact replay format for recorded games, with checkpoints to seek by move.
+
+"""
+Recorded games used to be pickles of the whole layout and move history (or,
+from unpack.py, of the agents as well), which are large, slow to load and
+tied to Python 2. A replay file holds instead:
+
+  the magic string 'PACRPLY1'
+  a header record: the layout text and name, the number of agents, the game
+                   length, the seed of the game and the checkpoint interval
+  chunk records:   a checkpoint of the full state (score, food, capsules and
+                   agents) followed by up to interval moves, a byte each
+  move records:    in a game recorded as it is played, the moves made since
+                   the last chunk, written after every move (the file is
+                   written again without them with the footer)
+  a footer record: the result of the game and the offsets of the chunks,
+                   followed by the offset of the footer and the string 'PEND'
+
+A record is a type byte, the length of its payload (4 bytes, big-endian) and
+the payload, compressed with zlib. A move is the index of its agent (5 bits)
+followed by the index of its action in ACTIONS (3 bits).
+
+The state after any move is found by decoding a single chunk and playing at
+most interval moves from its checkpoint. A file without a footer (a game that
+was cut short) is read by scanning its records, and its last moves are those
+of the move records after the last chunk.
+"""
+
+import os
+import json
+import struct
+import zlib
+
+import game
+import layout
+from game import Directions
+
+MAGIC = 'PACRPLY1'
+END = 'PEND'
+CHECKPOINT_INTERVAL = 200
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST,
+           Directions.STOP]
+
+def encodeMove(agentIndex, action):
+  return chr(agentIndex << 3 | ACTIONS.index(action))
+
+def decodeMoves(data):
+  return [(ord(c) >> 3, ACTIONS[ord(c) & 7]) for c in data]
+
+def encodeState(state):
+  "A checkpoint of a capture.GameState, as a dict that can be written as JSON"
+  data = state.data
+  agents = []
+  for agentState in data.agentStates:
+    (x, y), direction = agentState.configuration.getPosition(), agentState.configuration.getDirection()
+    agents.append([x, y, direction, agentState.isPacman, agentState.scaredTimer])
+  return {'score': data.score, 'capsules': data.capsules,
+          'food': list(data.food.packBits()), 'agents': agents}
+
+def decodeState(checkpoint, gameLayout, numAgents):
+  "The capture.GameState of a checkpoint made by encodeState (the first if None)"
+  import capture
+  state = capture.GameState()
+  state.initialize(gameLayout, numAgents)
+  if checkpoint is None:
+    return state
+  data = state.data
+  data.score = checkpoint['score']
+  data.capsules = [tuple(c) for c in checkpoint['capsules']]
+  data.food = game.reconstituteGrid(tuple(checkpoint['food']))
+  for agentState, (x, y, direction, isPacman, scaredTimer) in zip(data.agentStates,
+                                                                  checkpoint['agents']):
+    agentState.configuration = game.Configuration((x, y), str(direction))
+    agentState.isPacman = isPacman
+    agentState.scaredTimer = scaredTimer
+  return state
+
+def writeRecord(out, kind, payload):
+  "Writes a record and returns its offset"
+  offset = out.tell()
+  payload = zlib.compress(payload)
+  out.write(kind + struct.pack('>I', len(payload)) + payload)
+  return offset
+
+def readRecord(stream):
+  "Reads the record at the position of stream as (kind, payload), or None at the end"
+  head = stream.read(5)
+  if len(head) < 5:
+    return None
+  kind, size = head[0], struct.unpack('>I', head[1:])[0]
+  payload = stream.read(size)
+  if len(payload) < size:
+    return None
+  return kind, zlib.decompress(payload)
+
+def getResult(game):
+  "The result of a game of capture (over or not), for the footer"
+  score = game.state.data.score
+  return {'score': score, 'winner': 'Red' if score > 0 else 'Blue' if score < 0 else 'Tie',
+          'over': game.gameOver, 'crashedAgent': game.crashedAgent,
+          'timeout': game.agentTimeout}
+
+class ReplayWriter:
+  """
+  Writes a game to a replay file as it is played. Call start with the first
+  state, addMove after every move with the state it led to, and finish at
+  the end of the game. It is also the recorder of Game.setRecorder, which
+  calls end with the game instead of finish.
+
+  If live, every move is also written as a move record, and flushed, as it
+  is made, so that the game can be replayed up to its last move if it is cut
+  short, even by the process being killed. The move records are no longer
+  needed once the footer is written, so finish then replaces the file by a
+  copy without them.
+  """
+  def __init__(self, path, gameLayout, numAgents, length, seed=None, info=None,
+               interval=CHECKPOINT_INTERVAL, live=False):
+    self.path = path
+    self.out = open(path, 'wb')
+    self.interval = interval
+    self.live = live
+    self.numMoves = 0
+    self.moves = []
+    self.checkpoint = None
+    self.chunks = []
+    header = {'layout': gameLayout.layoutText, 'name': gameLayout.name,
+              'numAgents': numAgents, 'length': length, 'seed': seed,
+              'interval': interval, 'info': info or {}}
+    self.out.write(MAGIC)
+    writeRecord(self.out, 'H', json.dumps(header))
+    if live:
+      self.out.flush()
+
+  def start(self, state):
+    self.checkpoint = encodeState(state)
+
+  def addMove(self, agentIndex, action, state):
+    move = encodeMove(agentIndex, action)
+    self.moves.append(move)
+    self.numMoves += 1
+    if self.live:
+      writeRecord(self.out, 'M', move)
+      self.out.flush()
+    if len(self.moves) == self.interval:
+      self.writeChunk()
+      self.checkpoint = encodeState(state)
+
+  def writeChunk(self):
+    payload = json.dumps(self.checkpoint) + '\n' + ''.join(self.moves)
+    self.chunks.append(writeRecord(self.out, 'C', payload))
+    self.moves = []
+
+  def finish(self, result=None):
+    "Writes the last moves and a footer with result (a dict), and closes the file"
+    if self.moves:
+      self.writeChunk()
+    if self.live:
+      self.compact()
+    footer = dict(result or {}, moves=self.numMoves, index=self.chunks)
+    offset = writeRecord(self.out, 'F', json.dumps(footer))
+    self.out.write(struct.pack('>Q', offset) + END)
+    self.out.close()
+    if self.live:
+      os.rename(self.path + '.tmp', self.path)
+
+  def compact(self):
+    """
+    Copies the file but for its move records to path.tmp, where the footer
+    is then written. The file with the move records is kept until the copy
+    is complete and replaces it.
+    """
+    self.out.close()
+    stream = open(self.path, 'rb')
+    self.out = open(self.path + '.tmp', 'wb')
+    self.out.write(stream.read(len(MAGIC)))
+    self.chunks = []
+    record = readRecord(stream)
+    while record is not None:
+      kind, payload = record
+      if kind == 'C':
+        self.chunks.append(writeRecord(self.out, kind, payload))
+      elif kind != 'M':
+        writeRecord(self.out, kind, payload)
+      record = readRecord(stream)
+    stream.close()
+
+  def end(self, game):
+    self.finish(getResult(game))
+
+def writeGame(path, gameLayout, numAgents, actions, length, seed=None, result=None,
+              info=None):
+  "Writes a finished game, given by its moves, to a replay file"
+  import capture
+  state = capture.GameState()
+  state.initialize(gameLayout, numAgents)
+  writer = ReplayWriter(path, gameLayout, numAgents, length, seed, info)
+  writer.start(state)
+  for agentIndex, action in actions:
+    state = state.generateSuccessor(agentIndex, action)
+    writer.addMove(agentIndex, action, state)
+  writer.finish(result)
+
+class Replay:
+  """
+  Reads a replay file. The moves of a chunk are decoded when needed, and the
+  last chunk decoded is kept.
+  """
+  def __init__(self, path):
+    self.stream = open(path, 'rb')
+    if self.stream.read(len(MAGIC)) != MAGIC:
+      raise ValueError('%s is not a replay file' % path)
+    kind, header = readRecord(self.stream)
+    self.header = json.loads(header)
+    self.numAgents = self.header['numAgents']
+    self.interval = self.header['interval']
+    start = self.stream.tell()
+    self.tail = []
+    self.footer = self.readFooter()
+    if self.footer is not None:
+      self.chunks = self.footer['index']
+    else:
+      self.stream.seek(start)
+      self.chunks = self.scan()
+    self.cached = None, None
+
+  def readFooter(self):
+    "The footer of a complete file, or None"
+    self.stream.seek(0, 2)
+    if self.stream.tell() < len(MAGIC) + 12:
+      return None
+    self.stream.seek(-12, 2)
+    tail = self.stream.read(12)
+    if tail[8:] != END:
+      return None
+    self.stream.seek(struct.unpack('>Q', tail[:8])[0])
+    kind, footer = readRecord(self.stream)
+    return json.loads(footer)
+
+  def scan(self):
+    """
+    The offsets of the complete chunks, read one record after the other. The
+    moves of the move records after the last chunk are kept in self.tail.
+    """
+    chunks = []
+    while True:
+      offset = self.stream.tell()
+      record = readRecord(self.stream)
+      if record is None:
+        return chunks
+      if record[0] == 'C':
+        chunks.append(offset)
+        self.tail = []
+      elif record[0] == 'M':
+        self.tail.extend(decodeMoves(record[1]))
+
+  def readChunk(self, i):
+    "The checkpoint and moves of chunk i"
+    if self.cached[0] != i:
+      self.stream.seek(self.chunks[i])
+      kind, payload = readRecord(self.stream)
+      checkpoint, moves = payload.split('\n', 1)
+      self.cached = i, (json.loads(checkpoint), decodeMoves(moves))
+    return self.cached[1]
+
+  def getLayout(self):
+    return layout.Layout([str(line) for line in self.header['layout']],
+                         self.header['name'] and str(self.header['name']))
+
+  def getNumMoves(self):
+    if self.footer is not None:
+      return self.footer['moves']
+    return self.getChunkMoves() + len(self.tail)
+
+  def getChunkMoves(self):
+    "The number of moves in the chunks"
+    if not self.chunks:
+      return 0
+    return (len(self.chunks) - 1) * self.interval + len(self.readChunk(len(self.chunks) - 1)[1])
+
+  def getResult(self):
+    "The footer of the game (with score and winner, if recorded), or None if it was cut short"
+    return self.footer
+
+  def getMoves(self, start=0):
+    "The moves from move start, as (agentIndex, action)"
+    for i in range(start // self.interval, len(self.chunks)):
+      moves = self.readChunk(i)[1]
+      for move in moves[max(0, start - i * self.interval):]:
+        yield move
+    for move in self.tail[max(0, start - self.getChunkMoves()):]:
+      yield move
+
+  def getState(self, k, gameLayout=None):
+    "The capture.GameState after k moves, from the last checkpoint before it"
+    gameLayout = gameLayout or self.getLayout()
+    if not self.chunks:
+      state, moves = decodeState(None, gameLayout, self.numAgents), []
+    else:
+      i = min(k // self.interval, len(self.chunks) - 1)
+      checkpoint, moves = self.readChunk(i)
+      state = decodeState(checkpoint, gameLayout, self.numAgents)
+      k -= i * self.interval
+    if k > len(moves):
+      moves = moves + self.tail
+    for agentIndex, action in moves[:k]:
+      state = state.generateSuccessor(agentIndex, action)
+    return state
+
+  def close(self):
+    self.stream.close()
+
+def isReplay(path):
+  f = open(path, 'rb')
+  try: return f.read(len(MAGIC)) == MAGIC
+  finally: f.close()
+
+def loadReplay(path, start=0):
+  """
+  Loads a recorded game, in this format or as a pickle of an older version,
+  as the arguments of capture.replayGame. If start is given, the replay
+  begins with the state after that many moves.
+  """
+  if not isReplay(path):
+    import cPickle
+    recorded = cPickle.load(open(path, 'rb'))
+    if start:
+      import capture
+      state = capture.GameState()
+      state.initialize(recorded['layout'], len(recorded['agents']))
+      for agentIndex, action in recorded['actions'][:start]:
+        state = state.generateSuccessor(agentIndex, action)
+      recorded['state'] = state
+      recorded['actions'] = recorded['actions'][start:]
+    return recorded
+
+  replay = Replay(path)
+  gameLayout = replay.getLayout()
+  recorded = {'layout': gameLayout, 'length': replay.header['length'],
+              'agents': [game.Agent(i) for i in range(replay.numAgents)],
+              'actions': list(replay.getMoves(start)), 'seed': replay.header['seed']}
+  if start:
+    recorded['state'] = replay.getState(start, gameLayout)
+  replay.close()
+  return recorded
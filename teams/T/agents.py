@@ -4,12 +4,15 @@ import time
 
 import util
 import game
+import capture
 import captureAgents
 import keyboardAgents
 
 import board
 import tracking
 import strategy
+import feature
+import timing
 
 class TrackingAgent(captureAgents.CaptureAgent):
     """
@@ -24,9 +27,15 @@ class TrackingAgent(captureAgents.CaptureAgent):
         self.opponents = factory.opponents
         self.board = factory.board
         self.debug = debug
+        self.futureSearch = feature.SearchContext()
+        self.moveBudget = None
+        self.ponderStop = None
 
     def registerInitialState(self, gameState):
         "Initializes both local and shared data structures"
+        # The maze distances are computed here, so the base class reuses them
+        if not isinstance(self, StrategicGhost):
+            self.factory.precompute(gameState, self)
         captureAgents.CaptureAgent.registerInitialState(self, gameState)
         self.position = gameState.getInitialAgentPosition(self.index)
         self.factory.initializeShared(gameState,self)
@@ -36,29 +45,103 @@ class TrackingAgent(captureAgents.CaptureAgent):
         if self.debug:
             start = time.time()
 
+        if not isinstance(self, StrategicGhost):
+            self.startTurn()
+
         # Update the current position and beliefs
         self.position = gameState.getAgentPosition(self.index)
+        tracked = time.time()
         self.tracker.observe(gameState)
+        tracked = time.time() - tracked
 
         # Select an action and update position
+        chosen = time.time()
         action = self.strategy(self, gameState)
+        chosen = time.time() - chosen
         self.position = game.Actions.getSuccessor(self.position,action)
 
+        # Give tracking less time after a move that ran over its budget
+        if not isinstance(self, StrategicGhost):
+            self.moveBudget.charge('tracking', tracked)
+            self.moveBudget.charge('strategy', chosen)
+            self.tracker.particleFilter.adaptShare(self.moveBudget.isExpired())
+
+        # Keep the search tree below our move. The opponents' trees are only
+        # built inside our own searches, so they are not kept.
+        if not isinstance(self, StrategicGhost):
+            self.futureSearch.advance(gameState, self.index, action)
+            for ghost in self.opponents:
+                ghost.futureSearch.clear()
+
         # Write distributions to board for debugging and time
         if self.debug:
             if not isinstance(self, StrategicGhost):
                 print 'eval time for agent %d: %.4f, score: %d' % (self.index, time.time()-start, gameState.getScore())
+                print self.moveBudget
+                pf = self.tracker.particleFilter
+                print 'particles: %d, ess: %.1f, tracking time: %.4f' % (len(pf.particles), pf.effectiveSampleSize, pf.elapsed)
+                for table in self.factory.tables:
+                    print table
+                for orderer in self.factory.orderers:
+                    print orderer
+                print self.futureSearch
+                print self.factory.cache
             self.displayBeliefs(gameState)
 
         return action
 
+    def startTurn(self):
+        """
+        Tracking, the features and the search share the time of the move.
+        Entries from earlier moves may now be replaced by the searches. The
+        team cache is kept for the round, so that our other agent's move can
+        use its values.
+        """
+        moveTime = capture.CaptureRules().getMoveWarningTime(self.index)
+        self.moveBudget = timing.MoveBudget(moveTime, fixed=self.factory.fixedBudget)
+        self.factory.cache.newTurn(len(self.observationHistory))
+        self.precompute()
+        for table in self.factory.tables:
+            table.newSearch()
+        for orderer in self.factory.orderers:
+            orderer.newSearch()
+
+    def precompute(self):
+        "Carries on with the precomputation that did not fit in the startup time"
+        scheduler = self.factory.scheduler
+        if scheduler is not None and not scheduler.isFinished():
+            start = time.time()
+            scheduler.run(self.moveBudget.getDeadline(0.1))
+            self.moveBudget.charge('precompute', time.time() - start)
+            if self.debug:
+                print scheduler
+
     def getDistribution(self, gameState):
         dist = util.Counter()
         dist[self.chooseAction(gameState)] = 1.0
         return dist
 
+    def ponder(self, gameState, action, stop):
+        """
+        Called by pacclient after this agent played action in gameState, until
+        stop (a threading.Event) is set by the arrival of the next state. Lets
+        the strategy of our next agent to move search ahead.
+        """
+        nextIndex = (self.index + 2) % gameState.getNumAgents()
+        for agent in self.team:
+            if agent.index == nextIndex:
+                # Pondering is not bounded by the budget of a move, but
+                # every search stops when stop is set
+                agent.moveBudget = None
+                agent.ponderStop = stop
+                try:
+                    agent.strategy.ponder(agent, gameState, self, action, stop)
+                finally:
+                    agent.ponderStop = None
+
     def final(self, gameState):
         "This gets run after the game is finished. This might be useful."
+        self.factory.finalize()
 
         #print "Game is over"
 
@@ -113,12 +196,15 @@ class LearningAgent:
     linear combination of feature weights. It takes a feature strategy, which it
     uses to extract the weights and calculates which move it would make. Then it
     calls the nested agents getAction. Using this, it updates the weight vector.
+    The features of every move are kept in samples, as ({action: features},
+    correct), for the offline trainer of dataset.py.
     """
     def __init__(self, nested, strategy, weights={}):
         self.index = nested.index
         self.nested = nested
         self.weights = util.Counter(weights)
         self.strategy = strategy
+        self.samples = []
 
     def getAction(self, gameState):
         """
@@ -130,6 +216,7 @@ class LearningAgent:
         data = {a: self.strategy.getFeatures(self.nested, gameState, a)
                 for a in gameState.getLegalActions(self.index)}
         result, action = max(data.items(), key=lambda (_,x): x * self.weights)
+        self.samples.append((data, correct))
 
         if action != correct:
             self.weights += data[correct]
@@ -137,6 +224,12 @@ class LearningAgent:
 
         return correct
 
+    def __getattr__(self, name):
+        "The features search through teammates, so act as the nested agent"
+        if name == 'nested':
+            raise AttributeError(name)
+        return getattr(self.nested, name)
+
     def registerInitialState(self, gameState):
         "Call registerInitialState if it exists"
         self.position = gameState.getInitialAgentPosition(self.index)
@@ -150,7 +243,8 @@ class ReplayAgent(TrackingAgent):
     """
     This agent takes a stream of actions and performs them sequentially. This is
     particularly useful for replaying a prerecorded game. This agent can then be
-    wrapped by a LearningAgent to learn from a recorded game.
+    wrapped by a LearningAgent to learn from a recorded game. It tracks the
+    opponents as when playing, so that the features are those the agent saw.
     """
     def __init__(self, index, factory, actions, debug=True):
         TrackingAgent.__init__(self, index, factory, debug)
@@ -158,6 +252,10 @@ class ReplayAgent(TrackingAgent):
 
     def getAction(self, gameState):
         "Returns the next action. Assumes that the next action exists"
+        self.observationHistory.append(gameState)
+        self.startTurn()
+        self.position = gameState.getAgentPosition(self.index)
+        self.tracker.observe(gameState)
         i, a = self.actions.next()
         return a
 
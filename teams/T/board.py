@@ -18,9 +18,15 @@ class Board:
             self.initialize(gameState)
 
     def initialize(self, gameState):
+        """
+        Sets up the legal positions. The dead ends and border distances are
+        left empty, to be computed by initDeadEnd and initBorders when the
+        precomputation scheduler gets to them.
+        """
         self.walls = gameState.getWalls()
         self.initLegal()
-        self.initDeadEnd()
+        self.deadends = set()
+        self.borderDistances = {}
         #self.initAdjacency()
         #self.initFloydWarshall()
 
@@ -45,7 +51,7 @@ class Board:
         self.dist = [ [ min(self.dist[i][j], self.dist[i][k] + self.dist[k][j])
             for i in lr ] for k,j in itertools.product(lr,lr) ]
 
-    def initDeadEnd(self):
+    def initDeadEnd(self, steps=100):
         """
         Given the walls, we find all the states that have no cross edges. That
         is, all the locations that are part of a dead end cannot be escaped if
@@ -54,6 +60,11 @@ class Board:
         To do this, we compute tarjan's algorithm and find all the nodes that
         are part of a strongly connected component of size 1. This will reveal
         all the nodes which can only be escaped in one way.
+
+        The depth first search keeps its own stack of calls instead of
+        recursing, so that this can be a generator that pauses after every
+        steps positions, and the precomputation scheduler can spread it over
+        several turns.
         """
         # Starting values
         self.current = 0
@@ -61,44 +72,83 @@ class Board:
         index,lowlink = {},{}
         identified = set()
 
-
-        # Used to calculate the strongly connected components
-        def strongconnect(v):
-            # Init state
+        # Init state, and the edges of v still to be followed
+        def visit(v):
             index[v] = self.current
             lowlink[v] = self.current
             self.current += 1
             stack.append(v)
-
-            # For each edge
-            for w in self.getLegalNeighbors(v):
-                if w not in index:
-                    strongconnect(w)
-                    lowlink[v] = min(lowlink[v], lowlink[w])
-                elif w in identified:
-                    lowlink[v] = min(lowlink[v], index[w])
-
-            # Record the connected component if found
-            if lowlink[v] == index[v]:
-                scc = set(stack[index[v]:])
-                del stack[index[v]:]
-                identified.update(scc)
-                if len(scc) != 0:
-                    self.components.append(scc)
-                if len(scc) == 1:
-                    self.deadends.add(min(scc))
-
-            # Used to thread state (grrr...)
-            return self.current
+            return v, iter(self.getLegalNeighbors(v))
 
         # For each vertex
-        for v in self.legal:
-            if v not in index:
-                strongconnect(v)
-        
+        for root in self.legal:
+            if root in index:
+                continue
+            calls = [visit(root)]
+            while calls:
+                v, edges = calls[-1]
+
+                # For each edge, until one leads to a new vertex
+                for w in edges:
+                    if w not in index:
+                        calls.append(visit(w))
+                        break
+                    elif w in identified:
+                        lowlink[v] = min(lowlink[v], index[w])
+                else:
+                    calls.pop()
+
+                    # Record the connected component if found
+                    if lowlink[v] == index[v]:
+                        scc = set(stack[index[v]:])
+                        del stack[index[v]:]
+                        identified.update(scc)
+                        if len(scc) != 0:
+                            self.components.append(scc)
+                        if len(scc) == 1:
+                            self.deadends.add(min(scc))
+
+                    # Back in the caller
+                    if calls:
+                        u = calls[-1][0]
+                        lowlink[u] = min(lowlink[u], lowlink[v])
+                    continue
+
+                if self.current % steps == 0:
+                    yield
+
         print self.components
         print self.deadends
-    
+
+    def initBorders(self, distancer):
+        """
+        Finds the cells on either side of the midline, and the maze distance
+        from every position to the closest border cell of each side. This is a
+        generator that handles one position per step, so that it can be
+        spread over several turns.
+        """
+        midPoint = self.walls.width / 2
+        self.borders = {}
+        for red, x in ((True, midPoint - 1), (False, midPoint)):
+            self.borders[red] = [(x, y) for y in range(self.walls.height)
+                                 if not self.walls[x][y]]
+
+        for p in self.legal:
+            self.borderDistances[p] = dict((red, min(
+                distancer.getDistance(p, b) for b in self.borders[red]))
+                for red in (True, False))
+            yield
+
+    def getBorderDistance(self, position, red):
+        """
+        Distance from position to the border on red's side. Until initBorders
+        has reached position, the horizontal distance is used instead.
+        """
+        if position in self.borderDistances:
+            return self.borderDistances[position][red]
+        midPoint = self.walls.width / 2
+        return abs(position[0] - (midPoint - 1 if red else midPoint))
+
     def areAdjacent(self, p, q):
         "Tests if two different points are adjacent"
         a,b = abs(p[0]-q[0]),abs(p[1]-q[1])
@@ -0,0 +1,90 @@
+"""
+A cache of values derived from the state shared by the team, so that both
+agents, the features and the trackers compute each of them once. Any function
+whose first argument is an agent or a tracker can have its values kept in the
+team's TurnCache (Factory.cache) by decorating it with memoize.
+
+Keys are built from the shared state the value depends on. The particle filter
+and the food grid are replaced, not modified, when they change, so a key
+holding them by Identity is invalidated by any change to them. The whole cache
+is also cleared at the start of every round, once each agent has moved.
+"""
+
+import util
+
+class Identity:
+    """
+    A key that only matches the very object it was built from (compared by
+    identity, not value). It keeps the object alive, so that its id cannot be
+    reused by another object while it is cached.
+    """
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, Identity) and self.obj is other.obj
+
+class TurnCache:
+    """
+    Values by name and key for the current turn, with the number of hits and
+    misses of every name.
+    """
+    def __init__(self):
+        self.values = {}
+        self.turn = None
+        self.hits = util.Counter()
+        self.misses = util.Counter()
+
+    def newTurn(self, turn):
+        "Drops every value if turn is not the current turn"
+        if turn != self.turn:
+            self.turn = turn
+            self.invalidate()
+
+    def invalidate(self):
+        self.values = {}
+
+    def get(self, name, key, function, *args):
+        "The value of name for key, computed by function(*args) on a miss"
+        key = (name, key)
+        if key in self.values:
+            self.hits[name] += 1
+            return self.values[key]
+        self.misses[name] += 1
+        value = self.values[key] = function(*args)
+        return value
+
+    def getHitRate(self, name):
+        total = self.hits[name] + self.misses[name]
+        return float(self.hits[name]) / total if total else 0.0
+
+    def __str__(self):
+        names = sorted(set(self.hits.keys() + self.misses.keys()))
+        return 'team cache: %d values, %s' % (len(self.values), ', '.join(
+            '%s: %d/%d hits' % (name, self.hits[name], self.hits[name] +
+            self.misses[name]) for name in names) or 'unused')
+
+def findCache(owner):
+    "The TurnCache of the team of owner (an agent or a tracker), if any"
+    agent = getattr(owner, 'agent', owner)
+    return getattr(getattr(agent, 'factory', None), 'cache', None)
+
+def memoize(name, key):
+    """
+    Decorates a function of (owner, ...) so that its values are kept in the
+    owner's TurnCache under name and key(owner, ...). Cached values are shared,
+    so they must not be modified by their users.
+    """
+    def decorator(function):
+        def memoized(owner, *args):
+            cache = findCache(owner)
+            if cache is None:
+                return function(owner, *args)
+            return cache.get(name, key(owner, *args), function, owner, *args)
+        memoized.__name__ = function.__name__
+        memoized.__doc__ = function.__doc__
+        return memoized
+    return decorator
@@ -45,6 +45,7 @@ AgentFactory = 'factory.Factory'
 Partners = ['Liam Eagen','Pato Lankenau']
 
 AgentArgs = {'offensiveWeights': str(weights.offensive),
-             'defensiveWeights': str(weights.defensive)}
+             'defensiveWeights': str(weights.defensive),
+             'fixedBudget': 'False'}
 
 NotifyList = []
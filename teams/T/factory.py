@@ -2,10 +2,13 @@
 import itertools
 import ast
 import re
+import time
 
 # Game
 import game
 import pacman
+import capture
+import distanceCalculator
 import captureAgents
 import ghostAgents
 import keyboardAgents
@@ -15,6 +18,9 @@ import board
 import agents
 import tracking
 import strategy
+import parallel
+import precompute
+import cache
 
 class Factory(captureAgents.AgentFactory):
     """
@@ -30,14 +36,35 @@ class Factory(captureAgents.AgentFactory):
     def __init__(self, isRed, **args):
         captureAgents.AgentFactory.__init__(self,isRed)
         self.board = board.Board()
-        self.particleFilter = tracking.ContestParticleFilter(isRed, 100)
         self.team, self.opponents = [], []
         self.init = False
+        self.scheduler = None
+        self.startupMargin = 0.2
+        self.cache = cache.TurnCache()
+
+        # The transposition tables and move orderers of our searches, which
+        # go with the factory at the end of the game
+        self.tables = []
+        self.orderers = []
 
         # By default don't debug, learn, or use negamax
         self.debug = ast.literal_eval(args.get('debug', 'False'))
+
+        # A fixed budget makes the moves independent of the time they take,
+        # so that a seeded game can be played again
+        self.fixedBudget = ast.literal_eval(args.get('fixedBudget', 'False'))
+
+        # The particle filter starts small and adapts to the time budget
+        particles = ast.literal_eval(args.get('particles', '100'))
+        budget = ast.literal_eval(args.get('trackingBudget', '0.25'))
+        self.particleFilter = tracking.ContestParticleFilter(isRed, particles,
+                budget, fixed=self.fixedBudget)
         self.replay = ast.literal_eval(args.get('replay', '""'))
 
+        # Searches can be split across worker processes, forked at startup
+        self.numWorkers = ast.literal_eval(args.get('workers', '0'))
+        self.pool = None
+
         # Get the options for the first and second agents
         fst = ast.literal_eval(re.sub("\|", ",", args.get('first','{}')))
         snd = ast.literal_eval(re.sub("\|", ",", args.get('second','{}')))
@@ -48,6 +75,8 @@ class Factory(captureAgents.AgentFactory):
         self.defaults = ['ContestOffensive', 'ContestDefensive']
         self.strategies = []
         self.depths = []
+        self.budgets = []
+        self.orderings = []
 
         # Only use weights if provided
         offString = re.sub("\|", ",", args.get('offensiveWeights', '{}'))
@@ -73,15 +102,19 @@ class Factory(captureAgents.AgentFactory):
         stt = opt.get('strategy', self.defaults[idx % 2])
         rpl = opt.get('replay', '')
         dth = opt.get('depth', 0)
+        bgt = opt.get('budget', 0)
+        odr = opt.get('ordering', True)
         self.strategies.append(stt)
         self.depths.append(dth)
+        self.budgets.append(bgt)
+        self.orderings.append(odr)
 
         # Build the agent
         if stt in ['keys', 'Keys', 'keyboard', 'Keyboard']:
             agent = agents.KeyboardAgent(index, self, self.debug)
         elif rpl:
-            import cPickle
-            recorded = cPickle.load(open(rpl))
+            import replay
+            recorded = replay.loadReplay(rpl)
             actions = recorded["actions"][:]
             actions = itertools.ifilter(lambda (x,_): x==index, actions)
             agent = agents.ReplayAgent(index, self, iter(list(actions)), self.debug)
@@ -96,13 +129,45 @@ class Factory(captureAgents.AgentFactory):
         self.team.append(agent)
         return agent
 
+    def precompute(self, gameState, agent):
+        """
+        Runs the precomputation within agent's startup time, less a margin.
+        The first call schedules the tasks: the maze distances, board,
+        particle filter and worker pool are needed to play and always finish,
+        while the dead ends and border distances are found as time allows, a
+        step at a time, and are otherwise carried on by later calls (the other
+        agent's startup and then every move). With a fixed budget they all
+        finish at once.
+        """
+        startup = capture.CaptureRules().getMaxStartupTime(agent.index)
+        deadline = time.time() + startup * (1 - self.startupMargin)
+        if self.fixedBudget:
+            deadline = None
+        if self.scheduler is None:
+            self.scheduler = precompute.Scheduler()
+            distancer = distanceCalculator.Distancer(gameState.data.layout)
+            legal = lambda: self.board.getLegal()
+            self.scheduler.add('distances', distancer.getMazeDistances, 0, True)
+            self.scheduler.add('board', lambda: self.board.initialize(gameState), 1, True)
+            self.scheduler.add('particles', lambda:
+                    self.particleFilter.initialize(gameState, legal()), 2, True)
+            if self.numWorkers:
+                self.scheduler.add('workers', lambda:
+                        self.startWorkers(gameState, distancer), 3, True)
+            self.scheduler.add('deadEnds', self.board.initDeadEnd, 4)
+            self.scheduler.add('borders', lambda: self.board.initBorders(distancer), 5)
+        self.scheduler.run(deadline)
+        if self.debug:
+            print self.scheduler
+
+    def startWorkers(self, gameState, distancer):
+        "Forks the worker processes for the searches"
+        self.pool = parallel.WorkerPool(gameState, distancer, self.numWorkers)
+
     def initializeShared(self, gameState, agent):
         "Initializes the shared data structured for the agents"
         if not self.init:
-            # Build the board and main particle filter
             self.init = True
-            self.board.initialize(gameState)
-            self.particleFilter.initialize(gameState, self.board.getLegal())
 
             # Build the ghosts and add to particle filter
             oppIndex = agent.getOpponents(gameState)
@@ -125,13 +190,28 @@ class Factory(captureAgents.AgentFactory):
             current = getattr(strategy, self.strategies.pop(), strategy.ContestOffensive)
             current = current()
 
-            # If we want look ahead, then wrap the strategy in a negamax
+            # If we want look ahead, then wrap the strategy in a negamax. With
+            # a time budget, deepen iteratively (up to depth, if given). A
+            # fixed budget cannot stop the deepening, so it goes to depth, or 3.
             depth = self.depths.pop()
-            if depth:
-                current = strategy.Negamax(current, depth)
+            budget = self.budgets.pop()
+            order = self.orderings.pop()
+            if budget:
+                maxDepth = depth or (3 if self.fixedBudget else 10)
+                current = strategy.IterativeNegamax(current, budget, maxDepth, order)
+            elif depth:
+                current = strategy.Negamax(current, depth, order)
+            if isinstance(current, strategy.Negamax):
+                self.tables.append(current.table)
+                self.orderers.append(current.ordering)
 
             # Set the agent's strategy
             agent.strategy = current
 
+    def finalize(self):
+        "Releases the shared resources at the end of the game"
+        if self.pool is not None:
+            self.pool.close()
+
 
 
@@ -1,8 +1,14 @@
 import random
+import time
 
 import util
 import itertools
 import game
+import transposition
+import ordering
+import timing
+import cache
+import strategy
 
 """
 These functions are useful for calculating the distances of pacman and ghosts to
@@ -12,12 +18,28 @@ ghost, etc.
 def getDistances(agent, position, things):
     return [agent.getMazeDistance(position, t) for t in things]
 
+@cache.memoize('food', lambda agent, gameState:
+        (agent.red, cache.Identity(gameState.data.food.data)))
+def getFoodList(agent, gameState):
+    "The food we can eat, shared by the team while the food is unchanged"
+    return agent.getFood(gameState).asList()
+
+@cache.memoize('estimates', lambda agent:
+        (agent.red, cache.Identity(agent.tracker.particleFilter.particles)))
+def getEstimates(agent):
+    """
+    The most likely position of every opponent, shared by the team while the
+    particles are unchanged. The ghosts we simulate share the particle filter
+    too, but their opponents are our agents.
+    """
+    return [g.argMax() for g in agent.tracker.getBeliefIterable()]
+
 def getFoodDistances(agent, successor, position):
-    food = agent.getFood(successor).asList()
+    food = getFoodList(agent, successor)
     return getDistances(agent, position, food)
 
 def getOurFoodDistances(agent, successor, position):
-    ourFood = agent.getFood(successor).asList()
+    ourFood = getFoodList(agent, successor)
     return getDistances(agent, position, ourFood)
 
 def getCapsuleDistances(agent, successor, position):
@@ -29,7 +51,7 @@ def getOurCapsuleDistances(agent, successor, position):
     return getDistances(agent, position, ourCapsules)
 
 def getGhostDistances(agent, successor, position):
-    ghosts = (g.argMax() for g in agent.tracker.getBeliefIterable())
+    ghosts = getEstimates(agent)
     ghosts = (g for g in ghosts if agent.otherSide(successor, g))
     ghosts = (g for i, g in enumerate(ghosts) if
             successor.getAgentState(i).scaredTimer == 0)
@@ -37,14 +59,14 @@ def getGhostDistances(agent, successor, position):
     return getDistances(agent, position, ghosts)
 
 def getScaredGhostDistances(agent, successor, position):
-    ghosts = (g.argMax() for g in agent.tracker.getBeliefIterable())
+    ghosts = getEstimates(agent)
     ghosts = (g for g in ghosts if agent.otherSide(successor, g))
     ghosts = (g for i, g in enumerate(ghosts) if
             successor.getAgentState(i).scaredTimer > 0)
     return getDistances(agent, position, ghosts)
 
 def getPacmanDistances(agent, successor, position):
-    ghosts = (g.argMax() for g in agent.tracker.getBeliefIterable())
+    ghosts = getEstimates(agent)
     ghosts = (g for g in ghosts if agent.ourSide(successor, g))
     return [agent.getMazeDistance(position, g) for g in ghosts]
 
@@ -150,7 +172,7 @@ def bestFoodDistance(agent, successor, features=util.Counter()):
     consider the distance of the pacman to the closest food and the distance of
     the ghost to that food.
     """
-    ghosts = (g.argMax() for g in agent.tracker.getBeliefIterable())
+    ghosts = getEstimates(agent)
     position = successor.getAgentPosition(agent.index)
 
     # Get the distances to each of the food for the agent and the ghosts
@@ -244,54 +266,208 @@ def isDeadEnd(agent, gameState, features=util.Counter()):
     features['isDeadEnd'] = agent.board.isDeadEnd(gameState.getAgentPosition(agent.index))
     return features
 
-def negamax(agent, gameState, depth, color=1, a=-float('inf'), b=float('inf')):
+def borderDistance(agent, successor, features=util.Counter()):
+    "The distance to our side of the border, where the invaders come in"
+    position = successor.getAgentPosition(agent.index)
+    features['borderDistance'] = agent.board.getBorderDistance(position, agent.red)
+    return features
+
+class SearchNode:
     """
-    Computes minimax strategy of depth using the negamax algorithm. Note
-    that the strategy used as a heuristic (self.nested) is applied to the
-    agent with index (agent.index + depth) % numAgents. This is an adversary
-    if depth % 2 = 1.
+    A node of the game tree kept by a SearchContext. Like a transposition
+    table entry it keeps the depth, value, bound and best move of the deepest
+    search of its state, and also its children by action.
     """
-    # Select the next agent
-    nextIndex = (agent.index + 1) % gameState.getNumAgents()
-    nextAgent = agent.opponents[agent.getOpponents(gameState).index(nextIndex)]
-
-    # Get the current position, as well as the estimated position if
-    # the current is null. Update state for future recursions
-    previous = gameState.getAgentState(agent.index).copy()
-    if previous.getPosition() is None:
-        estimated = agent.tracker.getBeliefDistribution(agent.index).argMax()
-        conf = game.Configuration(estimated, game.Directions.STOP)
-        gameState.data.agentStates[agent.index] = game.AgentState(conf, previous.isPacman)
-
-    # Instead of performing negamax here, we perform a probablistic
-    # computation. We know the move distribution that we will make here, and
-    # as a result, we calculate the weighted average of the moves
-    moves = util.Counter()
-    for act in gameState.getLegalActions(agent.index):
-        if depth == 0 or gameState.isOver():
-            # Assumes we are red
-            val = gameState.getScore()
-            moves[act] = val * color
+    def __init__(self, key):
+        self.key = key
+        self.depth = -1
+        self.value = None
+        self.bound = None
+        self.move = None
+        self.children = {}
+
+    def getEntry(self):
+        if self.depth < 0:
+            return None
+        return self.depth, self.value, self.bound, self.move
+
+class SearchContext:
+    """
+    Computes futureScore for all the actions of a state with a single root
+    search and keeps the game tree between calls. The first time any action of
+    a state is asked for, every action is searched and the rest are served
+    from the tree. Nodes reached by different move orders are shared. When a
+    move is played (advance), the subtree below it is kept for the searches
+    of the next move and the rest of the tree is thrown away.
+
+    The roots are often states at the leaves of a Negamax search, in which
+    the opponents that cannot be seen were placed by the tracker. So the root
+    of the move played is found by getRootKey, which leaves them out.
+
+    The root is deepened one ply at a time, and deepening stops when the
+    agent's move budget runs out, so the scores may come from a shallower
+    search than asked for. While pondering, it stops when the agent's
+    ponderStop is set. The moves are ordered by the context's own orderer,
+    whose history is aged on every advance.
+    """
+    def __init__(self):
+        self.roots = {}
+        self.rootsByKey = {}
+        self.nodes = {}
+        self.created = 0
+        self.reused = 0
+        self.deadline = None
+        self.stop = None
+        self.orderer = ordering.MoveOrderer('futureScore')
+
+    def getNode(self, gameState, agentIndex, color, parent, action):
+        "Returns the child of parent reached by action, creating it if needed"
+        if action in parent.children:
+            return parent.children[action]
+        key = transposition.stateKey(gameState, agentIndex, color)
+        if key in self.nodes:
+            self.reused += 1
         else:
-            nextState = gameState.generateSuccessor(agent.index, act)
-            val, _ = negamax(nextAgent, nextState, depth-1, -color, -b, -a)
-            moves[act] = -val
-
-            # Alpha-beta pruning
-            a = max(a, -val)
-            if a >= b:
-                break
-
-    # Now we compute the maximum scoring move as well as its score and
-    # return. We could attempt to enrich this process using some sort of
-    # expectimax.
-    # if depth == self.depth:
-    #     print moves
-
-    gameState.data.agentStates[agent.index] = previous
-    return max((y, x) for x, y in moves.items())
-
-def futureScore(agent, successor, features=util.Counter(), depth=4):
-    features['futureScore'], _ = negamax(agent, successor, depth)
+            self.created += 1
+            self.nodes[key] = SearchNode(key)
+        parent.children[action] = self.nodes[key]
+        return self.nodes[key]
+
+    def getScores(self, agent, gameState, depth):
+        """
+        Returns a dict from each legal action of agent to the negamax value of
+        depth (at most) of its successor state.
+        """
+        key = transposition.stateKey(gameState, agent.index)
+        root = self.roots.get(key)
+        if root is None:
+            root = SearchNode(key)
+            root.depth = 0
+            for act in gameState.getLegalActions(agent.index):
+                successor = strategy.Strategy.getSuccessor(agent, gameState, act)
+                child = self.getNode(successor, agent.index, 1, root, act)
+                self.negamax(agent, successor, 0, child)
+            self.roots[key] = root
+            rootKey = getRootKey(gameState, agent.index)
+            self.rootsByKey.setdefault(rootKey, []).append(root)
+
+        # Deepen while the move budget lasts. A deeper search that is cut off
+        # still leaves the children at least as deep as before.
+        start = time.time()
+        self.deadline = timing.getDeadline(agent)
+        self.stop = getattr(agent, 'ponderStop', None)
+        try:
+            for d in range(root.depth + 1, depth + 1):
+                for act, child in root.children.items():
+                    successor = strategy.Strategy.getSuccessor(agent, gameState, act)
+                    self.negamax(agent, successor, d, child)
+                root.depth = d
+        except timing.SearchTimeout:
+            pass
+        self.deadline, self.stop = None, None
+        budget = getattr(agent, 'moveBudget', None)
+        if budget is not None:
+            budget.charge('futureScore', time.time() - start)
+        return dict((act, child.value) for act, child in root.children.items())
+
+    def negamax(self, agent, gameState, depth, node, color=1,
+            a=-float('inf'), b=float('inf'), ply=0):
+        """
+        Computes the negamax value of depth of gameState, with agent to move,
+        storing the results in the nodes of the tree. The opponents move as
+        estimated by our tracker when their positions are unknown.
+        """
+        self.orderer.visit(agent.index, depth)
+
+        # Select the next agent
+        nextIndex = (agent.index + 1) % gameState.getNumAgents()
+        nextAgent = agent.opponents[agent.getOpponents(gameState).index(nextIndex)]
+
+        # Get the current position, as well as the estimated position if
+        # the current is null. Update state for future recursions
+        previous = gameState.getAgentState(agent.index).copy()
+        if previous.getPosition() is None:
+            estimated = agent.tracker.getBeliefDistribution(agent.index).argMax()
+            conf = game.Configuration(estimated, game.Directions.STOP)
+            gameState.data.agentStates[agent.index] = game.AgentState(conf, previous.isPacman)
+
+        # Reuse the result already stored in the node if possible
+        alpha = a
+        value, move, a, b = transposition.probeEntry(node.getEntry(), depth, a, b)
+        if value is not None:
+            gameState.data.agentStates[agent.index] = previous
+            return value
+
+        moves = util.Counter()
+        actions = gameState.getLegalActions(agent.index)
+        if depth > 0:
+            actions = self.orderer.order(gameState, agent.index, actions, ply, move)
+        for act in actions:
+            if depth == 0 or gameState.isOver():
+                moves[act] = gameState.getScore() * color
+            else:
+                if ((self.deadline is not None and time.time() > self.deadline) or
+                        (self.stop is not None and self.stop.isSet())):
+                    gameState.data.agentStates[agent.index] = previous
+                    raise timing.SearchTimeout()
+                nextState = gameState.generateSuccessor(agent.index, act)
+                child = self.getNode(nextState, nextAgent.index, -color, node, act)
+                val = self.negamax(nextAgent, nextState, depth-1, child, -color,
+                        -b, -a, ply+1)
+                moves[act] = -val
+
+                # Alpha-beta pruning
+                a = max(a, -val)
+                if a >= b:
+                    self.orderer.cutoff(gameState, agent.index, act, ply, depth)
+                    break
+
+        gameState.data.agentStates[agent.index] = previous
+        value, move = max((y, x) for x, y in moves.items())
+        node.depth, node.value, node.move = depth, value, move
+        node.bound = transposition.getBound(value, alpha, b)
+        return value
+
+    def advance(self, gameState, agentIndex, action):
+        """
+        Called once action has been played from gameState. Keeps only the
+        subtrees below action of the roots that match gameState.
+        """
+        roots = self.rootsByKey.get(getRootKey(gameState, agentIndex), [])
+        stack = [root.children[action] for root in roots if action in root.children]
+        kept = {}
+        while stack:
+            node = stack.pop()
+            if node.key not in kept:
+                kept[node.key] = node
+                stack.extend(node.children.values())
+        self.roots, self.rootsByKey, self.nodes = {}, {}, kept
+        self.orderer.newSearch()
+
+    def clear(self):
+        self.roots, self.rootsByKey, self.nodes = {}, {}, {}
+
+    def __str__(self):
+        return 'futureScore tree: %d nodes kept, %d created, %d reused\n%s' % (
+                len(self.nodes), self.created, self.reused, self.orderer)
+
+def getRootKey(gameState, agentIndex):
+    """
+    The key of the root of a SearchContext for gameState, with agentIndex to
+    move, without the states of its opponents, which may have been estimated
+    """
+    key = transposition.stateKey(gameState, agentIndex)
+    red = gameState.isOnRedTeam(agentIndex)
+    agents = tuple(s if gameState.isOnRedTeam(i) == red else None
+                   for i, s in enumerate(key[1]))
+    return key[:1] + (agents,) + key[2:]
+
+def futureScore(agent, predecessor, action, features=util.Counter(), depth=4):
+    """
+    The negamax value of the state after action. All the actions of
+    predecessor are searched together by the agent's SearchContext.
+    """
+    scores = agent.futureSearch.getScores(agent, predecessor, depth)
+    features['futureScore'] = scores[action]
     return features
 
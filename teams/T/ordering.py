@@ -0,0 +1,110 @@
+"""
+Move ordering for the alpha-beta searches. Alpha-beta only prunes well if the
+best moves are searched first, so actions are sorted by: the move suggested by
+the transposition table (or the previous iteration), the killer moves of the
+ply, the history table, and finally a cheap static guess.
+"""
+
+import util
+import game
+
+class MoveOrderer:
+    """
+    Keeps the killer moves (the last moves that caused a cutoff) for every
+    ply, and a history table keyed by (agent, cell, action) that is credited
+    with depth^2 whenever that move causes a cutoff. The history is halved on
+    every new move, so that it follows the game. Also counts the nodes and
+    cutoffs for each agent to move, which measures how well ordering works.
+    """
+    def __init__(self, name, enabled=True, numKillers=2):
+        self.name = name
+        self.enabled = enabled
+        self.numKillers = numKillers
+        self.killers = {}
+        self.history = util.Counter()
+        self.nodes = util.Counter()
+        self.interior = util.Counter()
+        self.cutoffs = util.Counter()
+
+    def newSearch(self):
+        "Forgets the killers and ages the history at the start of a move"
+        self.killers = {}
+        for key in self.history.keys():
+            self.history[key] /= 2.0
+
+    def visit(self, agentIndex, depth):
+        "Counts a searched node"
+        self.nodes[agentIndex] += 1
+        if depth > 0:
+            self.interior[agentIndex] += 1
+
+    def order(self, gameState, agentIndex, actions, ply, first=None):
+        "Returns the actions in the order they should be searched"
+        if not self.enabled:
+            actions = list(actions)
+            if first in actions:
+                actions.remove(first)
+                actions.insert(0, first)
+            return actions
+
+        position = gameState.getAgentPosition(agentIndex)
+        killers = self.killers.get(ply, [])
+        static = staticOrder(gameState, agentIndex)
+        def score(action):
+            return (action == first, action in killers,
+                    self.history[(agentIndex, position, action)],
+                    static(action))
+        return sorted(actions, key=score, reverse=True)
+
+    def cutoff(self, gameState, agentIndex, action, ply, depth):
+        "Records that action caused a beta cutoff"
+        self.cutoffs[agentIndex] += 1
+        if not self.enabled:
+            return
+        killers = self.killers.setdefault(ply, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[self.numKillers:]
+        position = gameState.getAgentPosition(agentIndex)
+        self.history[(agentIndex, position, action)] += depth * depth
+
+    def getCutoffRate(self, agentIndex):
+        interior = self.interior[agentIndex]
+        return float(self.cutoffs[agentIndex]) / interior if interior else 0.0
+
+    def __str__(self):
+        agents = ', '.join('agent %d: %d nodes, %.2f cutoffs' % (i, self.nodes[i],
+            self.getCutoffRate(i)) for i in sorted(self.nodes.keys()))
+        return '%s ordering: %s' % (self.name, agents or 'no nodes')
+
+def staticOrder(gameState, agentIndex):
+    """
+    A cheap guess at how good each action is: eating food is good, moving
+    away from the closest visible defender is good when we are a pacman and
+    stopping is bad. Returns a function from action to score.
+    """
+    state = gameState.getAgentState(agentIndex)
+    position = state.getPosition()
+    if gameState.isOnRedTeam(agentIndex):
+        enemies = gameState.getBlueTeamIndices()
+    else:
+        enemies = gameState.getRedTeamIndices()
+    ghosts = [gameState.getAgentPosition(i) for i in enemies
+              if not gameState.getAgentState(i).isPacman]
+    ghosts = [g for g in ghosts if g is not None]
+    closest = None
+    if state.isPacman and ghosts:
+        closest = min(ghosts, key=lambda g: util.manhattanDistance(position, g))
+
+    def score(action):
+        if action == game.Directions.STOP:
+            return -1
+        x, y = game.Actions.getSuccessor(position, action)
+        value = 0
+        if gameState.hasFood(int(x), int(y)):
+            value += 2
+        if closest is not None:
+            before = util.manhattanDistance(position, closest)
+            value += util.manhattanDistance((x, y), closest) - before
+        return value
+    return score
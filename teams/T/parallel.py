@@ -0,0 +1,101 @@
+"""
+Root-parallel search across processes. The workers of a WorkerPool are forked
+when the team is initialized, after the layout is loaded and the maze
+distances are computed, so they inherit a simulator.Simulator and are only
+sent the compact SimState and a share of the particles on every move. Each
+worker grows its own Monte Carlo tree from the root and the root statistics
+are summed (root parallelization). If the workers cannot be started, or fail
+or are late during a move, the pool is shut down and the searches run in the
+game process. So do they when the game itself is played in a daemonic worker
+(as by the pools of evolve.py, league.py and farm.py), which cannot have
+children.
+"""
+
+import random
+import time
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+import simulator
+import strategy
+
+# The simulator of the workers, which they inherit when they are forked
+_simulator = None
+
+def searchRoot(task):
+    "Runs a Monte Carlo search in a worker and returns its root statistics"
+    parameters, seed, args = task
+    random.seed(seed)
+    return strategy.MonteCarlo(*parameters).search(_simulator, *args)
+
+class WorkerPool:
+    """
+    A pool of numWorkers processes for the searches of a team. The results of
+    a worker are waited for until its deadline plus timeout; workers stop
+    searching margin seconds before the deadline of the move, to leave time
+    for the results to be sent back.
+    """
+    def __init__(self, gameState, distancer, numWorkers, margin=0.02, timeout=0.25):
+        global _simulator
+        self.simulator = simulator.Simulator(gameState, distancer)
+        self.margin = margin
+        self.timeout = timeout
+        self.pool = None
+        if multiprocessing is None or numWorkers < 1:
+            return
+        if multiprocessing.current_process().daemon:
+            return
+
+        _simulator = self.simulator
+        try:
+            self.pool = multiprocessing.Pool(numWorkers)
+            self.numWorkers = numWorkers
+        except (OSError, IOError, AssertionError):
+            self.pool = None
+
+    def getNumWorkers(self):
+        return self.numWorkers if self.pool is not None else 0
+
+    def search(self, parameters, state, particles, hidden, index, red, deadline):
+        """
+        Splits the particles between the workers and merges their results, as
+        MonteCarlo.search. Returns None if there are no workers or they failed.
+        """
+        if self.pool is None:
+            return None
+
+        # Every worker gets its own particles and random seed
+        particles = particles[:]
+        random.shuffle(particles)
+        tasks = []
+        for k in range(self.numWorkers):
+            share = particles[k::self.numWorkers] or particles
+            args = (state, share, hidden, index, red, deadline - self.margin)
+            tasks.append((parameters, random.getrandbits(32), args))
+
+        try:
+            pending = self.pool.map_async(searchRoot, tasks)
+            results = pending.get(max(0, deadline - time.time()) + self.timeout)
+        except Exception:
+            self.close()
+            return None
+
+        # Sum the root statistics
+        children, playouts, nodes, maxDepth = {}, 0, 0, 0
+        for stats, n, size, depth in results:
+            for action, (visits, total) in stats.items():
+                before = children.get(action, (0, 0.0))
+                children[action] = (before[0] + visits, before[1] + total)
+            playouts += n
+            nodes += size
+            maxDepth = max(maxDepth, depth)
+        return children, playouts, nodes, maxDepth
+
+    def close(self):
+        "Stops the workers, after which searches run in process"
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
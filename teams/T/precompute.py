@@ -0,0 +1,79 @@
+"""
+Scheduling of the team's precomputation. registerInitialState has a startup
+budget (CaptureRules.getMaxStartupTime), and the work done then grows with the
+layout. The Scheduler runs the precomputation tasks in order of priority within
+a deadline; whatever does not fit is carried into later turns and run a slice
+at a time from the move budget.
+"""
+
+import time
+import types
+
+import util
+
+class Scheduler:
+    """
+    A list of named tasks run in order of priority (lowest first, then in the
+    order they were added). A task is a function of no arguments. If it
+    returns a generator, the task is run one step (next()) at a time and can
+    be paused between steps, so that long tasks can be spread over turns.
+    Required tasks are always run to the end, whatever the deadline.
+
+    The time spent on every task is kept in self.spent, and the tasks that
+    have finished, in order, in self.finished.
+    """
+    def __init__(self):
+        self.tasks = []
+        self.running = {}
+        self.finished = []
+        self.spent = util.Counter()
+
+    def add(self, name, task, priority=0, required=False):
+        self.tasks.append((priority, len(self.tasks), name, task, required))
+        self.tasks.sort()
+
+    def run(self, deadline):
+        "Runs the pending tasks until they are done or deadline (if any) has passed"
+        while self.tasks:
+            priority, order, name, task, required = self.tasks[0]
+            if not required and deadline is not None and time.time() >= deadline:
+                break
+            start = time.time()
+            done = self.step(name, task, None if required else deadline)
+            self.spent[name] += time.time() - start
+            if not done:
+                break
+            self.tasks.pop(0)
+            self.finished.append(name)
+
+    def step(self, name, task, deadline):
+        """
+        Runs task until it is done (returns True) or deadline, if any, has
+        passed (returns False).
+        """
+        if name not in self.running:
+            result = task()
+            if not isinstance(result, types.GeneratorType):
+                return True
+            self.running[name] = result
+        generator = self.running[name]
+        try:
+            while deadline is None or time.time() < deadline:
+                generator.next()
+        except StopIteration:
+            del self.running[name]
+            return True
+        return False
+
+    def isDone(self, name):
+        return name in self.finished
+
+    def isFinished(self):
+        return not self.tasks
+
+    def __str__(self):
+        done = ', '.join('%s: %.3f' % (name, self.spent[name])
+                         for name in self.finished)
+        pending = ', '.join(name for _, _, name, _, _ in self.tasks)
+        return 'precomputation done: %s; pending: %s' % (done or 'none',
+                pending or 'none')
@@ -0,0 +1,140 @@
+"""
+A stripped-down capture simulator for rollouts. It follows the rules of
+capture.AgentRules (eating, capsules, scared ghosts, deaths and the food win
+condition) on a compact state of plain lists and sets, with no display,
+muting, layouts or deepCopy, so that a rollout costs a few microseconds per
+move. Unlike GameState, every agent position is known: unseen opponents must
+be filled in (determinized) before a simulation starts.
+"""
+
+import random
+
+import game
+import capture
+
+class SimState:
+    "The mutable part of a simulated game"
+    def copy(self):
+        state = SimState()
+        state.positions = self.positions[:]
+        state.scared = self.scared[:]
+        state.food = set(self.food)
+        state.foodLeft = self.foodLeft[:]
+        state.capsules = self.capsules[:]
+        state.targets = self.targets[:]
+        state.score = self.score
+        state.over = self.over
+        return state
+
+class Simulator:
+    """
+    Holds the static parts of the game (moves from every cell, start
+    positions, teams) and plays moves on SimStates. The default rollout
+    policy is cheap: an agent chases the closest invader while it is a ghost
+    on its own side, and otherwise walks to a food pellet on the other side,
+    with a random move every so often.
+    """
+    def __init__(self, gameState, distancer, epsilon=0.2):
+        walls = gameState.getWalls()
+        self.halfway = walls.width / 2
+        self.numAgents = gameState.getNumAgents()
+        self.red = [gameState.isOnRedTeam(i) for i in range(self.numAgents)]
+        self.starts = [gameState.getInitialAgentPosition(i)
+                       for i in range(self.numAgents)]
+        self.distance = distancer.getDistanceOnGrid
+        self.epsilon = epsilon
+
+        # The legal (action, successor) pairs from every cell
+        self.moves, self.successors = {}, {}
+        for cell in walls.asList(False):
+            conf = game.Configuration(cell, game.Directions.STOP)
+            self.moves[cell] = [(a, game.Actions.getSuccessor(cell, a)) for a in
+                    game.Actions.getPossibleActions(conf, walls)]
+            self.successors[cell] = dict(self.moves[cell])
+
+    def getState(self, gameState, positions):
+        """
+        Builds the simulated state of gameState, with the agents at positions
+        (a list with an entry for every agent).
+        """
+        state = SimState()
+        state.positions = [tuple(int(c) for c in p) for p in positions]
+        state.scared = [gameState.getAgentState(i).scaredTimer
+                        for i in range(self.numAgents)]
+        state.food = set(gameState.data.food.asList())
+        redFood = len([f for f in state.food if f[0] < self.halfway])
+        state.foodLeft = [redFood, len(state.food) - redFood]
+        state.capsules = list(gameState.data.capsules)
+        state.targets = [None] * self.numAgents
+        state.score = gameState.getScore()
+        state.over = gameState.isOver()
+        return state
+
+    def isPacman(self, index, position):
+        return (position[0] >= self.halfway) == self.red[index]
+
+    def getLegalActions(self, state, index):
+        return [a for a, _ in self.moves[state.positions[index]]]
+
+    def step(self, state, index, action):
+        "Plays action for agent index, following capture.AgentRules"
+        position = self.successors[state.positions[index]][action]
+        state.positions[index] = position
+        red = self.red[index]
+        pacman = self.isPacman(index, position)
+
+        # Eat food and capsules on the other side
+        if pacman and position in state.food:
+            state.food.remove(position)
+            state.score += 1 if red else -1
+            side = 1 if red else 0
+            state.foodLeft[side] -= 1
+            if state.foodLeft[side] <= capture.MIN_FOOD:
+                state.over = True
+        if pacman and position in state.capsules:
+            state.capsules.remove(position)
+            for i in range(self.numAgents):
+                if self.red[i] != red:
+                    state.scared[i] = capture.SCARED_TIME
+
+        # Collisions. A pacman dies on a ghost unless the ghost is scared, in
+        # which case the ghost is eaten.
+        for i in range(self.numAgents):
+            if self.red[i] == red or state.positions[i] != position:
+                continue
+            if pacman == self.isPacman(i, position):
+                continue
+            ghost, other = (i, index) if pacman else (index, i)
+            dead = other if state.scared[ghost] <= 0 else ghost
+            state.positions[dead] = self.starts[dead]
+            state.scared[dead] = 0
+
+        state.scared[index] = max(0, state.scared[index] - 1)
+
+    def policy(self, state, index, rng=random):
+        "Chooses the rollout action of agent index"
+        moves = self.moves[state.positions[index]]
+        if rng.random() < self.epsilon:
+            return rng.choice(moves)[0]
+
+        # Ghosts on our side chase invaders
+        position = state.positions[index]
+        target = None
+        if not self.isPacman(index, position):
+            invaders = [state.positions[i] for i in range(self.numAgents)
+                        if self.red[i] != self.red[index] and
+                        self.isPacman(i, state.positions[i])]
+            if invaders:
+                target = min(invaders, key=lambda p: self.distance(position, p))
+
+        # Otherwise, keep walking to a food pellet on the other side
+        if target is None:
+            target = state.targets[index]
+            if target not in state.food:
+                food = [f for f in state.food if self.isPacman(index, f)]
+                if not food:
+                    return rng.choice(moves)[0]
+                target = min(food, key=lambda f: self.distance(position, f))
+                state.targets[index] = target
+
+        return min(moves, key=lambda (a, p): self.distance(p, target))[0]
@@ -1,5 +1,7 @@
+import math
 import random
 import itertools
+import time
 
 import util
 import game
@@ -10,6 +12,10 @@ import agents
 import board
 import tracking
 import feature
+import transposition
+import ordering
+import simulator
+import timing
 
 class Strategy:
     """
@@ -50,6 +56,15 @@ class Strategy:
         "Selects the action given a gamestate"
         return util.raiseNotDefined()
 
+    def ponder(self, agent, gameState, mover, action, stop):
+        """
+        Called while the other agents are moving, after mover (a teammate of
+        agent) played action in gameState, with agent to move next on our
+        team. Strategies may search ahead, but must return as soon as stop (a
+        threading.Event) is set. By default, does nothing.
+        """
+        pass
+
 class Nothing(Strategy):
     def __call__(self, *_):
         "Useful for debugging the tracker"
@@ -66,23 +81,59 @@ class Negamax(Strategy):
     algorithm is equivalent to minimax, but it is easier to implement and also
     has a cool name. It uses the internal strategy to compute the heuristic.
     """
-    def __init__(self, nested, depth=3):
+    def __init__(self, nested, depth=3, order=True):
         self.nested = nested
         self.depth = depth
+        self.deadline = None
+        self.stop = None
+        self.nodes = 0
+        self.table = transposition.TranspositionTable('negamax')
+        self.ordering = ordering.MoveOrderer('negamax', order)
 
     def __call__(self, agent, gameState):
-        state = capture.GameState(gameState)
-        value, action = self.negamax(agent, state, self.depth)
+        # If the move budget runs out, fall back to the heuristic
+        self.deadline = timing.getDeadline(agent)
+        try:
+            state = self.estimateState(agent, gameState)
+            value, action = self.negamax(agent, state, self.depth)
+        except timing.SearchTimeout:
+            action = self.nested(agent, gameState)
+        self.deadline = None
         return action
 
-    def negamax(self, agent, gameState, depth, a=-float('inf'), b=float('inf')):
+    def estimateState(self, agent, gameState):
+        """
+        Returns a copy of gameState in which every agent that cannot be seen is
+        placed at its most likely position according to the tracker. Otherwise
+        the heuristic would be evaluated with missing opponents.
+        """
+        state = capture.GameState(gameState)
+        for i in range(state.getNumAgents()):
+            previous = state.getAgentState(i)
+            if previous.getPosition() is None:
+                estimated = agent.tracker.getBeliefDistribution(i).argMax()
+                conf = game.Configuration(estimated, game.Directions.STOP)
+                state.data.agentStates[i] = game.AgentState(conf, previous.isPacman)
+                state.data.agentStates[i].start = previous.start
+        return state
+
+    def negamax(self, agent, gameState, depth, a=-float('inf'), b=float('inf'),
+            first=None, ply=0):
         """
         Computes minimax strategy of depth using the negamax algorithm. Note
         that the strategy used as a heuristic (self.nested) is applied to the
         agent with index (agent.index + depth) % numAgents. This is an adversary
         if depth % 2 = 1.
+
+        If first is a legal action it is searched before the others (otherwise
+        the best move from the transposition table is), followed by the moves
+        suggested by self.ordering. ply is the distance from the root. Raises
+        SearchTimeout once self.deadline (if any) has passed or self.stop (if
+        any) is set.
         """
-        print "negaMaxing"
+        self.nodes += 1
+        self.ordering.visit(agent.index, depth)
+
         # Select the next agent
         nextIndex = (agent.index + 1) % gameState.getNumAgents()
         nextAgent = agent.opponents[agent.getOpponents(gameState).index(nextIndex)]
@@ -96,22 +147,42 @@ class Negamax(Strategy):
             conf = game.Configuration(estimated, game.Directions.STOP)
             gameState.data.agentStates[agent.index] = game.AgentState(conf, previous.isPacman)
 
+        # Reuse the result of an earlier search of this position if it is deep
+        # enough, otherwise just narrow the window and search its move first
+        key = transposition.stateKey(gameState, agent.index)
+        alpha = a
+        value, move, a, b = transposition.probe(self.table, key, depth, a, b)
+        if value is not None:
+            gameState.data.agentStates[agent.index] = previous
+            return value, move
+        if first is None:
+            first = move
+
         # Instead of performing negamax here, we perform a probablistic
         # computation. We know the move distribution that we will make here, and
         # as a result, we calculate the weighted average of the moves
         moves = util.Counter()
-        for act in gameState.getLegalActions(agent.index):
+        actions = gameState.getLegalActions(agent.index)
+        if depth > 0:
+            actions = self.ordering.order(gameState, agent.index, actions, ply, first)
+        for act in actions:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise timing.SearchTimeout()
+            if self.stop is not None and self.stop.isSet():
+                raise timing.SearchTimeout()
             if depth == 0 or gameState.isOver():
                 val = self.nested.evaluate(agent, gameState, act)
                 moves[act] = val * color
             else:
                 nextState = self.getSuccessor(agent, gameState, act)
-                val, _ = self.negamax(nextAgent, nextState, depth-1, -b, -a)
+                val, _ = self.negamax(nextAgent, nextState, depth-1, -b, -a,
+                        ply=ply+1)
                 moves[act] = -val
 
                 # Alpha-beta pruning
                 a = max(a, -val)
                 if a >= b:
+                    self.ordering.cutoff(gameState, agent.index, act, ply, depth)
                     break
 
         # Now we compute the maximum scoring move as well as its score and
@@ -121,7 +192,279 @@ class Negamax(Strategy):
         #     print moves
 
         gameState.data.agentStates[agent.index] = previous
-        return max((y, x) for x, y in moves.items())
+        value, move = max((y, x) for x, y in moves.items())
+        bound = transposition.getBound(value, alpha, b)
+        self.table.store(key, depth, value, bound, move)
+        return value, move
+
+class IterativeNegamax(Negamax):
+    """
+    An anytime version of Negamax. It searches to depth 1, 2, 3... with the
+    best move of the previous iteration searched first, until budget (a
+    fraction of the move warning time) or the agent's move budget is used up,
+    or maxDepth is reached. The
+    move from the deepest completed search is returned. The depth reached,
+    nodes searched and nodes per second are recorded for every move in
+    self.stats.
+
+    While the other agents move, it ponders: it deepens on the states it
+    expects next and keeps the depth reached and best move for each. If the
+    real state is one of them, deepening resumes from there, with the
+    transposition table holding the pondered tree.
+    """
+    def __init__(self, nested, budget=0.5, maxDepth=10, order=True):
+        Negamax.__init__(self, nested, maxDepth, order)
+        self.budget = budget
+        self.stats = []
+        self.pondered = {}
+        self.ponderHits = 0
+        self.ponderMisses = 0
+
+    def __call__(self, agent, gameState):
+        start = time.time()
+        self.deadline = timing.getDeadline(agent, self.budget)
+        self.nodes = 0
+
+        # Resume from a pondered search of this state, if there is one
+        state = self.estimateState(agent, gameState)
+        key = transposition.stateKey(state, agent.index)
+        if self.pondered:
+            if key in self.pondered:
+                self.ponderHits += 1
+            else:
+                self.ponderMisses += 1
+        completed, action = self.pondered.get(key, (0, None))
+        self.pondered = {}
+
+        # Deepen until we run out of time. A search that is cut off is thrown
+        # away, since its result is only a partial tree.
+        try:
+            for depth in range(completed + 1, self.depth + 1):
+                state = self.estimateState(agent, gameState)
+                value, action = self.negamax(agent, state, depth, first=action)
+                completed = depth
+        except timing.SearchTimeout:
+            pass
+        self.deadline = None
+
+        # Record the statistics of the search
+        elapsed = time.time() - start
+        self.stats.append((completed, self.nodes, self.nodes / max(elapsed, 1e-6)))
+        if getattr(agent, 'debug', False):
+            print 'search depth: %d, nodes: %d, nodes/s: %.0f' % self.stats[-1]
+            if self.ponderHits or self.ponderMisses:
+                print 'ponder hits: %d, misses: %d' % (self.ponderHits, self.ponderMisses)
+
+        # If not even depth 1 finished, fall back to the heuristic
+        if not completed:
+            return self.nested(agent, gameState)
+        return action
+
+    def ponder(self, agent, gameState, mover, action, stop):
+        """
+        Deepens on the states that can follow mover's action, once the
+        opponent in between has moved. The other agents that cannot be seen
+        are at their most likely positions, and the opponent's moves are tried
+        most likely first, as the tracker models them (the getDistribution of
+        its StrategicGhost), then by ordering.staticOrder. Nothing is pondered
+        if the opponent cannot be seen, since the state we will be given then
+        depends on where the tracker places it. Stops when stop is set, which
+        the leaf searches of the features (see agents.TrackingAgent.ponder)
+        check as well.
+        """
+        numAgents = gameState.getNumAgents()
+        opponent = (mover.index + 1) % numAgents
+        if gameState.getAgentPosition(opponent) is None:
+            return
+        ghost = agent.opponents[agent.getOpponents(gameState).index(opponent)]
+
+        state = self.getSuccessor(mover, self.estimateState(agent, gameState), action)
+        likely = ghost.getDistribution(state)
+        static = ordering.staticOrder(state, opponent)
+        actions = sorted(state.getLegalActions(opponent),
+                         key=lambda a: (likely[a], static(a)), reverse=True)
+        predicted = [self.getSuccessor(ghost, state, a) for a in actions]
+
+        self.stop = stop
+        try:
+            for state in predicted:
+                key = transposition.stateKey(state, agent.index)
+                completed, best = 0, None
+                try:
+                    for depth in range(1, self.depth + 1):
+                        value, best = self.negamax(agent, state, depth, first=best)
+                        completed = depth
+                finally:
+                    if completed:
+                        self.pondered[key] = (completed, best)
+        except timing.SearchTimeout:
+            pass
+        self.stop = None
+
+class MonteCarloNode:
+    "A node of the Monte Carlo search tree, with the agent to move at it"
+    def __init__(self, index):
+        self.index = index
+        self.children = {}
+        self.visits = 0
+        self.total = 0.0
+
+class MonteCarlo(Strategy):
+    """
+    Monte Carlo tree search (UCT) under a time budget, a fraction of the move
+    warning time cut short by the agent's move budget. Every iteration places the opponents we cannot see by
+    sampling a particle from the tracker's joint belief (determinization),
+    descends the tree with UCB1, expands one node and then plays a rollout of
+    rolloutDepth moves with the cheap policy of simulator.Simulator. The
+    reward is the change in score for our team. The most visited action at
+    the root is played.
+
+    If the factory has a parallel.WorkerPool, the particles are split between
+    its workers, each of which grows its own tree, and the root statistics are
+    summed. Otherwise, or if the workers fail, the search runs in process.
+    With a fixed move budget there is no deadline: the search runs in process
+    for a fixed number of playouts.
+
+    The number of playouts, playouts per second, tree size, depth and number
+    of workers are recorded for every move in self.stats.
+    """
+    def __init__(self, budget=0.5, rolloutDepth=40, exploration=1.0,
+            playouts=200):
+        self.budget = budget
+        self.rolloutDepth = rolloutDepth
+        self.exploration = exploration
+        self.playouts = playouts
+        self.simulator = None
+        self.layout = None
+        self.stats = []
+
+    def getParameters(self):
+        "The arguments to rebuild this strategy, in a worker process"
+        return self.budget, self.rolloutDepth, self.exploration, self.playouts
+
+    def getSimulator(self, agent, gameState):
+        "The simulator of the pool, or one built for the layout"
+        pool = getattr(agent.factory, 'pool', None)
+        if pool is not None:
+            return pool.simulator
+        layout = capture.getLayoutKey(gameState.data.layout)
+        if self.simulator is None or self.layout != layout:
+            self.simulator = simulator.Simulator(gameState, agent.distancer)
+            self.layout = layout
+        return self.simulator
+
+    def select(self, node, legal, ours):
+        "UCB1 over the children of node that are legal in this determinization"
+        logVisits = math.log(node.visits)
+        def ucb(action):
+            child = node.children[action]
+            mean = child.total / child.visits
+            if not ours:
+                mean = -mean
+            return mean + self.exploration * math.sqrt(logVisits / child.visits)
+        return max(legal, key=ucb)
+
+    def search(self, sim, rootState, particles, hidden, index, red, deadline):
+        """
+        Searches from rootState until deadline (or for self.playouts playouts
+        if it is None), with agent index to move. For every playout, the agents
+        in hidden, a list of (ghost, agent index) pairs, are placed by a random
+        particle. Returns the statistics of the root: a dict from action to
+        (visits, total reward), the number of playouts, the number of tree
+        nodes and the depth of the tree.
+        """
+        numAgents = len(rootState.positions)
+        sign = 1 if red else -1
+        root = MonteCarloNode(index)
+        playouts, maxDepth = 0, 0
+
+        while not playouts or (playouts < self.playouts if deadline is None
+                               else time.time() < deadline):
+            state = rootState.copy()
+            particle = random.choice(particles)
+            for g, i in hidden:
+                state.positions[i] = particle[g]
+
+            # Selection and expansion
+            node, mover, path = root, index, [root]
+            while not state.over:
+                legal = sim.getLegalActions(state, mover)
+                untried = [a for a in legal if a not in node.children]
+                if untried:
+                    action = random.choice(untried)
+                    node.children[action] = MonteCarloNode(mover)
+                else:
+                    ours = sim.red[mover] == red
+                    action = self.select(node, legal, ours)
+                sim.step(state, mover, action)
+                node = node.children[action]
+                path.append(node)
+                mover = (mover + 1) % numAgents
+                if untried:
+                    break
+            maxDepth = max(maxDepth, len(path) - 1)
+
+            # Rollout
+            for _ in range(self.rolloutDepth):
+                if state.over:
+                    break
+                sim.step(state, mover, sim.policy(state, mover))
+                mover = (mover + 1) % numAgents
+
+            # Backpropagation, from our team's point of view
+            reward = sign * (state.score - rootState.score)
+            for node in path:
+                node.visits += 1
+                node.total += reward
+            playouts += 1
+
+        children = dict((a, (c.visits, c.total)) for a, c in root.children.items())
+        return children, playouts, countNodes(root), maxDepth
+
+    def __call__(self, agent, gameState):
+        start = time.time()
+        deadline = timing.getDeadline(agent, self.budget)
+        sim = self.getSimulator(agent, gameState)
+
+        # The opponents we cannot see are placed by the tracker's particles
+        particleFilter = agent.tracker.particleFilter
+        particles = list(particleFilter.particles)
+        positions = [gameState.getAgentPosition(i)
+                     for i in range(gameState.getNumAgents())]
+        hidden = [(g, i) for g, i in enumerate(particleFilter.ghostIndices)
+                  if positions[i] is None]
+        for g, i in hidden:
+            positions[i] = particles[0][g]
+        state = sim.getState(gameState, positions)
+
+        # Search in the worker processes if there are any
+        task = (state, particles, hidden, agent.index, agent.red, deadline)
+        pool = getattr(agent.factory, 'pool', None)
+        result, workers = None, 0
+        if pool is not None and deadline is not None:
+            result = pool.search(self.getParameters(), *task)
+            workers = pool.getNumWorkers()
+        if result is None:
+            result, workers = self.search(sim, *task), 0
+        children, playouts, nodes, maxDepth = result
+
+        # Record the statistics of the search
+        elapsed = time.time() - start
+        self.stats.append((playouts, playouts / max(elapsed, 1e-6), nodes,
+            maxDepth, workers))
+        if getattr(agent, 'debug', False):
+            print 'playouts: %d, playouts/s: %.0f, tree nodes: %d, depth: %d, workers: %d' % self.stats[-1]
+
+        # Only consider moves that are legal in the real state
+        legal = gameState.getLegalActions(agent.index)
+        visited = [a for a in legal if a in children]
+        if not visited:
+            return random.choice(legal)
+        return max(visited, key=lambda a: children[a][0])
+
+def countNodes(node):
+    "The number of nodes in a Monte Carlo search tree"
+    return 1 + sum(countNodes(c) for c in node.children.values())
 
 class Feature(Strategy):
     """
@@ -193,9 +536,12 @@ class ContestOffensive(Feature):
         feature.disperse(agent, successor, features)
         feature.feasts(agent, successor, features)
         feature.foodDownPath(agent, gameState, successor, features)
-        feature.futureScore(agent, successor, features)
         feature.trapped(agent, successor, features)
 
+        # The search is left out when the move budget is nearly used up
+        if not timing.isShort(agent, gameState):
+            feature.futureScore(agent, gameState, action, features)
+
         feature.capsuleDistance(agent, successor, features)
         feature.scaredGhostDistance(agent, successor, features)
 
@@ -220,9 +566,13 @@ class ContestDefensive(Feature):
         feature.ourFoodDistances(agent, successor, features)
         feature.onDefense(agent, successor, features)
         feature.disperse(agent, successor, features)
-        feature.feasts(agent, successor, features)
         feature.invaderDistance(agent, successor, features)
         feature.isScared(agent, successor, features)
+        feature.borderDistance(agent, successor, features)
+
+        # Counting the feasts is slow, and is left out when short of time
+        if not timing.isShort(agent, gameState):
+            feature.feasts(agent, successor, features)
 
         # Features specifically concerning moves
         state = gameState.getAgentState(agent.index)
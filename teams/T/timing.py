@@ -0,0 +1,98 @@
+"""
+The time budget of a move. Tracking, the features and the search all spend the
+same move warning time, so TrackingAgent.chooseAction creates a MoveBudget for
+every move and each part checks it and records what it used. A part that is
+short of time degrades instead of running over: the particle filter carries
+fewer particles, futureScore searches less deep, the searches stop early and
+the strategies leave out their expensive features.
+
+A fixed budget (the factory's fixedBudget option, which capture.py turns on for
+seeded games) never runs short or out, so that the moves depend on the seed of
+the game and not on the speed of the machine.
+"""
+
+import time
+
+import util
+import capture
+
+class SearchTimeout(Exception):
+    "Raised inside a search when its deadline has passed"
+    pass
+
+class MoveBudget:
+    """
+    The time of a single move: the move warning time less a safety margin (a
+    fraction), counted from when the budget is created. The time spent by
+    each part of the agent is kept by name in self.spent. A fixed budget only
+    records the time spent: it never expires and has no deadlines.
+    """
+    def __init__(self, moveTime, margin=0.1, fixed=False):
+        self.start = time.time()
+        self.moveTime = moveTime
+        self.fixed = fixed
+        self.deadline = self.start + moveTime * (1 - margin)
+        self.spent = util.Counter()
+        self.shortState = None
+
+    def getElapsed(self):
+        return time.time() - self.start
+
+    def getRemaining(self):
+        return max(0.0, self.deadline - time.time())
+
+    def getDeadline(self, fraction=1.0):
+        "The time at which a part given fraction of the remaining time must stop"
+        if self.fixed:
+            return None
+        return time.time() + fraction * self.getRemaining()
+
+    def isExpired(self):
+        return not self.fixed and time.time() >= self.deadline
+
+    def isShort(self, gameState, fraction=0.25):
+        """
+        Whether less than fraction of the budget is left, so that the expensive
+        features of gameState are left out. The answer does not change while
+        the actions of the same state are evaluated one after the other, so
+        that they all have the same features.
+        """
+        if self.fixed:
+            return False
+        if self.shortState is None or self.shortState[0] is not gameState:
+            short = self.getRemaining() < fraction * (self.deadline - self.start)
+            self.shortState = gameState, short
+        return self.shortState[1]
+
+    def charge(self, name, seconds):
+        "Records that the part name spent seconds"
+        self.spent[name] += seconds
+
+    def __str__(self):
+        parts = ''.join(', %s: %.3f' % (name, self.spent[name])
+                        for name in sorted(self.spent.keys()))
+        return 'move time: %.3f of %.3f%s' % (self.getElapsed(),
+                self.deadline - self.start, parts)
+
+def isShort(agent, gameState):
+    "Whether agent is short of time for gameState (never without a move budget)"
+    budget = getattr(agent, 'moveBudget', None)
+    return budget is not None and budget.isShort(gameState)
+
+def getDeadline(agent, fraction=None):
+    """
+    The time by which a search of agent must stop: after fraction of the move
+    warning time if given, and no later than the end of the agent's move
+    budget. None if neither applies (such as while pondering) or the move
+    budget is fixed.
+    """
+    budget = getattr(agent, 'moveBudget', None)
+    if budget is not None and budget.fixed:
+        return None
+    deadline = None
+    if fraction is not None:
+        moveTime = capture.CaptureRules().getMoveWarningTime(agent.index)
+        deadline = time.time() + fraction * moveTime
+    if budget is not None:
+        deadline = min(deadline or budget.deadline, budget.deadline)
+    return deadline
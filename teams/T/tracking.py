@@ -3,14 +3,17 @@ import util
 import random
 # import busters
 import operator
+import time
 
 import game
 import capture
 
+import cache
+
 # Replaces busters
-def getEmissionModel(gameState, noisy):
-    "Used to calculate P(noisy | true)"
-    return lambda true: gameState.getDistanceProb(true, noisy)
+def getEmissionModel(gameState, position, noisy):
+    "Used to calculate P(noisy | ghost position) for every legal position"
+    return gameState.getDistanceMask(position, noisy)
 
 class Tracker:
     """
@@ -53,11 +56,21 @@ class Tracker:
             dist[self.gameState.getAgentPosition(ghost)] = 1.0
             return dist
         else:
-            jointDistribution = self.particleFilter.getBeliefDistribution()
-            dist = util.Counter()
-            for t, prob in jointDistribution.items():
-                dist[t[self.opponents.index(ghost)]] += prob
-            return dist
+            return self.getMarginal(ghost)
+
+    @cache.memoize('marginal', lambda tracker, ghost:
+            (cache.Identity(tracker.particleFilter.particles), ghost))
+    def getMarginal(self, ghost):
+        """
+        The marginal belief over an opponent of the team (a tracked ghost),
+        shared by our agents and the opponents' GhostTrackers.
+        """
+        g = self.particleFilter.ghostIndices.index(ghost)
+        jointDistribution = self.particleFilter.getBeliefDistribution()
+        dist = util.Counter()
+        for t, prob in jointDistribution.items():
+            dist[t[g]] += prob
+        return dist
 
     def getBeliefIterable(self):
         "Returns an iterable of belief distributions for the adversaries"
@@ -69,6 +82,10 @@ class GhostTracker(Tracker):
     ghosts. This is an important distinction. It does not record observations,
     and is necessary for interfacing with strategies.
     """
+    def __init__(self, particleFilter, gameState, agent):
+        Tracker.__init__(self, particleFilter, gameState, agent)
+        self.gameState = gameState
+
     def observe(self, gameState):
         self.gameState = gameState
 
@@ -79,11 +96,7 @@ class GhostTracker(Tracker):
             dist[self.gameState.getAgentPosition(ghost)] = 1.0
             return dist
         else:
-            jointDistribution = self.particleFilter.getBeliefDistribution()
-            dist = util.Counter()
-            for t, prob in jointDistribution.items():
-                dist[t[self.team.index(ghost)]] += prob
-            return dist
+            return self.getMarginal(ghost)
 
 class NaiveTracker(Tracker):
     """
@@ -117,10 +130,25 @@ class ContestParticleFilter:
     Therefore, on each turn, we have a larger body of evidence to use. Also
     supports using conditionally dependent ghost distributions like
     JointParticleFilter.
+
+    The number of particles adapts every turn, so that tracking takes about
+    budget (a fraction) of the move warning time. That share shrinks after
+    moves that ran over their budget and recovers slowly. The time, particle
+    count and effective sample size of the last turn are kept for the debug
+    output. A fixed filter keeps numParticles throughout.
     """
 
-    def __init__(self, isRed, numParticles=600):
+    def __init__(self, isRed, numParticles=600, budget=0.25, minParticles=50,
+            maxParticles=2000, fixed=False):
         self.isRed = isRed
+        self.budget = budget
+        self.fixed = fixed
+        self.share = 1.0
+        self.minParticles = minParticles
+        self.maxParticles = maxParticles
+        self.timePerParticle = None
+        self.elapsed = 0.0
+        self.effectiveSampleSize = float(numParticles)
         self.setNumParticles(numParticles)
 
     def setNumParticles(self, numParticles):
@@ -134,8 +162,11 @@ class ContestParticleFilter:
         # Sets the ghost indices so that we can initialize the particles
         if not self.isRed:
             self.ghostIndices = gameState.getRedTeamIndices()
+            ourIndex = gameState.getBlueTeamIndices()[0]
         else:
             self.ghostIndices = gameState.getBlueTeamIndices()
+            ourIndex = gameState.getRedTeamIndices()[0]
+        self.moveTime = capture.CaptureRules().getMoveWarningTime(ourIndex)
 
         # Set the positions and a uniform prior
         self.legalPositions = legalPositions
@@ -185,10 +216,9 @@ class ContestParticleFilter:
         Storing your particles as a Counter (where there could be an associated
         weight with each position) is incorrect and may produce errors.
         """
-        self.particles = []
-        for i in range(self.numParticles):
-            self.particles.append(tuple(util.sample(self.uniformPrior) for _ in
-                    self.ghostIndices))
+        sampler = util.Sampler(self.uniformPrior)
+        columns = [sampler.sampleN(self.numParticles) for _ in self.ghostIndices]
+        self.particles = zip(*columns)
 
     def addGhostAgent(self, agent):
         """
@@ -229,12 +259,14 @@ class ContestParticleFilter:
         """
         if len(noisyDistances) < self.numGhosts:
             return
+        start = time.time()
         positions = [ gameState.getAgentPosition(i) for i in self.ghostIndices ]
-        emissionModels = [ getEmissionModel(gameState, dist) for dist in
-                noisyDistances ]
+        emissionModels = [ getEmissionModel(gameState, pacmanPosition, dist)
+                for dist in noisyDistances ]
 
         # The distribution over states (tuples of ghost locations)
         allPossible = util.Counter()
+        weightSum, weightSquares = 0.0, 0.0
 
         for p in self.particles:
             # All ghosts that are visible, we set specifically
@@ -242,7 +274,7 @@ class ContestParticleFilter:
                     for g in range(self.numGhosts))
 
             # A generator that returns probabilities for non-jailed ghosts
-            gen = (emissionModels[g](util.manhattanDistance(p[g],pacmanPosition))
+            gen = (emissionModels[g].get(p[g], 0.0)
                     for g in range(self.numGhosts) if positions[g] == None)
 
             # Calculate the marginal distributions for each ghost
@@ -252,6 +284,17 @@ class ContestParticleFilter:
             # Take the product of the ghost products and update the distribution
             prod = reduce(operator.mul, gen, 1.0)
             allPossible[p] += prod
+            weightSum += prod
+            weightSquares += prod * prod
+
+        # Effective sample size of the weighted particles, then pick the
+        # number of particles to carry into the next turn
+        if weightSquares:
+            self.effectiveSampleSize = weightSum * weightSum / weightSquares
+        else:
+            self.effectiveSampleSize = 0.0
+        self.elapsed += time.time() - start
+        self.adaptNumParticles()
 
         # If nothing works, then resample everything
         #print allPossible
@@ -260,8 +303,8 @@ class ContestParticleFilter:
             self.particles = [tuple(positions[g] if positions[g] is not None else p[g]
                 for g in range(self.numGhosts)) for p in self.particles]
         else:
-            allPossible.normalize()
-            self.particles = [ util.sample(allPossible) for p in self.particles ]
+            sampler = util.Sampler(allPossible)
+            self.particles = sampler.systematic(self.numParticles)
 
     def elapseTime(self, gameState, ghost):
         """
@@ -307,6 +350,7 @@ class ContestParticleFilter:
               self.ghostAgents[ghostIndex-1], but in this project all ghost
               agents are always the same.
         """
+        start = time.time()
         newParticles = []
         for oldParticle in self.particles:
             # We only update one ghost in this loop now, since only one ghost
@@ -319,6 +363,36 @@ class ContestParticleFilter:
             newParticle[ghost] = util.sample(newPosDist)
             newParticles.append(tuple(newParticle))
         self.particles = newParticles
+        self.elapsed = time.time() - start
+
+    def adaptNumParticles(self):
+        """
+        Chooses the number of particles for the next resampling so that a
+        turn of tracking (elapseTime and observeState) takes self.budget of
+        the move warning time. The time per particle is smoothed so that a
+        single slow turn does not collapse the filter.
+        """
+        if self.fixed:
+            return
+        perParticle = self.elapsed / max(len(self.particles), 1)
+        if self.timePerParticle is None:
+            self.timePerParticle = perParticle
+        else:
+            self.timePerParticle = 0.8 * self.timePerParticle + 0.2 * perParticle
+        allowed = self.budget * self.share * self.moveTime
+        target = allowed / max(self.timePerParticle, 1e-6)
+        self.setNumParticles(int(max(self.minParticles,
+                min(self.maxParticles, target))))
+
+    def adaptShare(self, overran):
+        """
+        Called after each of our moves. Cuts the time given to tracking when
+        the move ran over its budget, and otherwise restores it a little.
+        """
+        if overran:
+            self.share = max(0.25, self.share * 0.7)
+        else:
+            self.share = min(1.0, self.share * 1.1)
 
     def getBeliefDistribution(self):
         dist = util.Counter()
@@ -0,0 +1,136 @@
+"""
+Transposition tables for the negamax searches. Capture positions transpose
+heavily (agents reach the same cell by different move orders, and opponents
+oscillate), so every searched node is remembered along with the depth it was
+searched to, its value, whether that value is exact or only a bound, and the
+best move found.
+"""
+
+import sys
+
+# Bound types of a stored value
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# The food keys of the food grids seen lately, by the identity of their data
+# (with the data, so that its id is not reused while it is here). Successors
+# share the data of the food grid until some food is eaten.
+_foodKeys = {}
+MAX_FOOD_KEYS = 1024
+
+def foodKey(food):
+    "The positions of the food of a Grid, found once for all grids sharing its data"
+    entry = _foodKeys.get(id(food.data))
+    if entry is None or entry[0] is not food.data:
+        if len(_foodKeys) >= MAX_FOOD_KEYS:
+            _foodKeys.clear()
+        entry = _foodKeys[id(food.data)] = (food.data, tuple(food.asList()))
+    return entry[1]
+
+def stateKey(gameState, agentIndex, *extra):
+    """
+    Returns a key identifying the parts of gameState that matter to a search
+    when agentIndex is about to move. Unlike GameState.__hash__ this is exact,
+    so different states never share an entry.
+    """
+    agents = tuple((s.configuration and s.configuration.pos,
+                    s.configuration and s.configuration.direction,
+                    s.isPacman, s.scaredTimer)
+                   for s in gameState.data.agentStates)
+    food = foodKey(gameState.data.food)
+    return (agentIndex, agents, food, tuple(gameState.data.capsules),
+            gameState.data.score) + extra
+
+class TranspositionTable:
+    """
+    A fixed size table of search results. Each key maps to a single slot. A
+    slot is replaced if it is empty, was written on an earlier turn, or holds
+    a shallower search than the new one (depth-preferred with aging). Entries
+    are kept across turns, so positions searched last move are reused.
+    """
+    def __init__(self, name, size=2**16):
+        self.name = name
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def newSearch(self):
+        "Marks the start of a new move, which ages the existing entries"
+        self.generation += 1
+
+    def lookup(self, key):
+        """
+        Returns (depth, value, bound, move) for key, or None if it has not
+        been stored.
+        """
+        self.lookups += 1
+        slot = self.slots[hash(key) % self.size]
+        if slot is None or slot[0] != key:
+            return None
+        self.hits += 1
+        return slot[1:5]
+
+    def store(self, key, depth, value, bound, move):
+        "Stores a search result, subject to the replacement policy"
+        index = hash(key) % self.size
+        slot = self.slots[index]
+        if (slot is None or slot[5] != self.generation or slot[0] == key
+                or depth >= slot[1]):
+            self.slots[index] = (key, depth, value, bound, move, self.generation)
+            self.stores += 1
+
+    def clear(self):
+        self.slots = [None] * self.size
+
+    def getHitRate(self):
+        return float(self.hits) / self.lookups if self.lookups else 0.0
+
+    def getMemory(self):
+        "Approximate number of bytes used by the table and its keys"
+        total = sys.getsizeof(self.slots)
+        for slot in self.slots:
+            if slot is not None:
+                total += sys.getsizeof(slot) + sys.getsizeof(slot[0])
+                total += sum(sys.getsizeof(k) for k in slot[0])
+        return total
+
+    def __str__(self):
+        used = sum(1 for slot in self.slots if slot is not None)
+        return '%s table: %d/%d entries, hit rate: %.2f, memory: %dkB' % (
+                self.name, used, self.size, self.getHitRate(),
+                self.getMemory() / 1024)
+
+def probe(table, key, depth, a, b):
+    """
+    Looks key up for a search of the given depth with window (a, b). Returns
+    (value, move, a, b): value is not None if the stored result settles the
+    node, move is the stored best move (to be searched first) and the window
+    is narrowed by any stored bound.
+    """
+    return probeEntry(table.lookup(key), depth, a, b)
+
+def probeEntry(entry, depth, a, b):
+    "As probe, given the (depth, value, bound, move) entry or None"
+    if entry is None:
+        return None, None, a, b
+    storedDepth, value, bound, move = entry
+    if storedDepth >= depth:
+        if bound == EXACT:
+            return value, move, a, b
+        elif bound == LOWER:
+            a = max(a, value)
+        elif bound == UPPER:
+            b = min(b, value)
+        if a >= b:
+            return value, move, a, b
+    return None, move, a, b
+
+def getBound(value, a, b):
+    "The bound type of value, found by a search with window (a, b)"
+    if value <= a:
+        return UPPER
+    elif value >= b:
+        return LOWER
+    return EXACT
@@ -0,0 +1,31 @@
+# test_analytics.py
+# -----------------
+# Run from the top directory: python -m unittest discover tests
+
+import os
+import unittest
+
+import analytics
+import layout
+import replay
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LayoutNameTest(unittest.TestCase):
+  def testOldPickle(self):
+    "The layouts of old pickles have no name, but the same text as the file"
+    recorded = replay.loadReplay(os.path.join(TOP, 'recorded-game-14-20-10-3-54'))
+    self.assertEqual(analytics.getLayoutName(recorded['layout']), 'defaultCapture')
+
+  def testNamed(self):
+    named = layout.getLayout('defaultCapture')
+    self.assertEqual(analytics.getLayoutName(named), 'defaultCapture')
+
+  def testUnknown(self):
+    text = ['%%%%', '%12%', '%%%%']
+    first, second = layout.Layout(text), layout.Layout(text[:])
+    self.assertTrue(analytics.getLayoutName(first).startswith('unknown-'))
+    self.assertEqual(analytics.getLayoutName(first), analytics.getLayoutName(second))
+
+if __name__ == '__main__':
+  unittest.main()
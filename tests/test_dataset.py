@@ -0,0 +1,79 @@
+# test_dataset.py
+# ---------------
+# Run from the top directory: python -m unittest discover tests
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+# The teams are found as capture.py finds them when run from the top directory
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(TOP, 'teams'))
+
+import capture
+import dataset
+import layout
+import replay
+
+def recordGame(path, starter, numMoves=40, seed=0):
+  "Writes a replay of random legal moves, made in turn from agent starter"
+  rng = random.Random(seed)
+  gameLayout = layout.getLayout('defaultCapture')
+  state = capture.GameState()
+  state.initialize(gameLayout, 4)
+  actions = []
+  for k in range(numMoves):
+    agentIndex = (starter + k) % 4
+    action = rng.choice(state.getLegalActions(agentIndex))
+    state = state.generateSuccessor(agentIndex, action)
+    actions.append((agentIndex, action))
+  replay.writeGame(path, gameLayout, 4, actions, numMoves)
+  return actions
+
+class ExportTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def checkExport(self, starter):
+    path = os.path.join(self.directory, 'replay_%d' % starter)
+    actions = recordGame(path, starter)
+
+    # The game played again, to check its moves against the recording
+    games = []
+    newGame = capture.CaptureRules.newGame
+    def keepGame(rules, *args):
+      games.append(newGame(rules, *args))
+      return games[-1]
+    capture.CaptureRules.newGame = keepGame
+    try:
+      samples = dataset.getSamples(path)
+    finally:
+      capture.CaptureRules.newGame = newGame
+    self.assertEqual(games[0].moveHistory, actions)
+    for agentIndex, role, moves in samples:
+      self.assertEqual([chosen for _, chosen in moves],
+                       [a for i, a in actions if i == agentIndex])
+    recording, samples, error = dataset.exportFile((path, self.directory))
+    self.assertEqual(error, None)
+    self.assertEqual(samples, len(actions))
+
+  def testRedStarts(self):
+    self.checkExport(0)
+
+  def testBlueStarts(self):
+    "The recording is played again from agent 1, whatever newGame picks"
+    original = random.randint
+    random.randint = lambda a, b: 0
+    try:
+      self.checkExport(1)
+    finally:
+      random.randint = original
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,17 @@
+# test_evolve.py
+# --------------
+# Run from the top directory: python -m unittest discover tests
+
+import unittest
+
+import evolve
+
+class CommandTest(unittest.TestCase):
+  def testPopulation(self):
+    "The optimizers need two candidates to compare"
+    for population in ('0', '1'):
+      self.assertRaises(Exception, evolve.readCommand, ['-p', population])
+    self.assertEqual(evolve.readCommand(['-p', '2']).population, 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,32 @@
+# test_farm.py
+# ------------
+# Run from the top directory: python -m unittest discover tests
+
+import unittest
+
+import farm
+
+class JobQueueTest(unittest.TestCase):
+  def setUp(self):
+    self.jobs = farm.JobQueue(maxAttempts=3)
+    self.id, = self.jobs.submit(['task'])
+    self.jobs.take('first', wait=0)
+    self.jobs.leave('first')
+
+  def testLateWhileQueued(self):
+    "The first worker finishes the game after it was put back in the queue"
+    self.jobs.finish(self.id, 'late', 'first')
+    self.assertEqual(self.jobs.jobs[self.id]['state'], 'done')
+    self.assertEqual(self.jobs.jobs[self.id]['result'], 'late')
+    self.assertEqual(self.jobs.take('second', wait=0), (None, None))
+
+  def testLateWhileRunning(self):
+    "Whichever worker finishes the requeued game first gives the result"
+    self.jobs.take('second', wait=0)
+    self.jobs.finish(self.id, 'late', 'first')
+    self.jobs.finish(self.id, 'again', 'second')
+    self.assertEqual(self.jobs.jobs[self.id]['result'], 'late')
+    self.assertEqual(self.jobs.workers['second']['job'], None)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+# test_league.py
+# --------------
+# Run from the top directory: python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# The teams are found as capture.py finds them when run from the top directory
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(TOP, 'teams'))
+
+import league
+
+CONFIG = """
+TeamName = 'Broken'
+AgentFactory = 'factory.Factory'
+Partners = []
+AgentArgs = {}
+NotifyList = []
+"""
+
+class LoadTest(unittest.TestCase):
+  def setUp(self):
+    "A team whose factory module does not compile"
+    self.directory = tempfile.mkdtemp()
+    team = os.path.join(self.directory, 'Broken')
+    os.mkdir(team)
+    for name, text in (('__init__.py', ''), ('config.py', CONFIG),
+                       ('factory.py', 'class Factory(:\n')):
+      out = open(os.path.join(team, name), 'w')
+      out.write(text)
+      out.close()
+    sys.path.insert(0, self.directory)
+    self.stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+
+  def tearDown(self):
+    sys.stderr.close()
+    sys.stderr = self.stderr
+    sys.path.remove(self.directory)
+    shutil.rmtree(self.directory)
+
+  def testCanLoad(self):
+    self.assertTrue(league.canLoad('BaselineAgents'))
+    self.assertFalse(league.canLoad('Broken'))
+    self.assertFalse(league.canLoad('NoSuchTeam'))
+
+if __name__ == '__main__':
+  unittest.main()
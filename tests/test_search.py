@@ -0,0 +1,52 @@
+# test_search.py
+# --------------
+# Run from the top directory: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+# The teams are found as capture.py finds them when run from the top directory
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(TOP, 'teams'))
+
+import capture
+import T.feature as feature
+
+def playGame(redOpts, numMoves=40, seed=1):
+  "Plays a quiet game of team T against BaselineAgents"
+  options = capture.readCommand(['-r', 'T', '-b', 'BaselineAgents', '-q',
+                                 '-i', str(numMoves), '--seed', str(seed),
+                                 '--redOpts', redOpts])
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    return capture.runGames(**options)[0]
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+
+class SubtreeTest(unittest.TestCase):
+  def getKept(self, redOpts):
+    "The number of nodes kept by every advance of the futureScore trees in a game"
+    kept = []
+    advance = feature.SearchContext.advance
+    def keepCount(context, *args):
+      advance(context, *args)
+      kept.append(len(context.nodes))
+    feature.SearchContext.advance = keepCount
+    try:
+      playGame(redOpts)
+    finally:
+      feature.SearchContext.advance = advance
+    return kept
+
+  def testFeatures(self):
+    self.assertTrue(any(self.getKept('')))
+
+  def testNegamax(self):
+    "The roots are estimated states at the leaves of the negamax search"
+    self.assertTrue(any(self.getKept("first={'depth':2}")))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,35 @@
+# test_seed.py
+# ------------
+# Run from the top directory: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+# The teams are found as capture.py finds them when run from the top directory
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(TOP, 'teams'))
+
+import capture
+
+def playGame(argv):
+  "Plays a quiet game and returns it"
+  options = capture.readCommand(argv)
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    return capture.runGames(**options)[0]
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+
+class SeedTest(unittest.TestCase):
+  def testFixedBudget(self):
+    "A seeded game of T against T is played again move for move"
+    argv = ['-r', 'T', '-b', 'T', '-q', '-i', '200', '--gameSeed', '7']
+    first, second = playGame(argv), playGame(argv)
+    self.assertEqual(first.moveHistory, second.moveHistory)
+    self.assertEqual(first.state.data.score, second.state.data.score)
+
+if __name__ == '__main__':
+  unittest.main()
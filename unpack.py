@@ -6,23 +6,288 @@
 # John DeNero (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
-import os, cPickle, sys
-
-if len(sys.argv) != 3: 
-  print 'Usage: %s stats_file team_name' % sys.argv[0]
-  print 'Unpacks the stats file of a server into a bunch of replay files.'
-  if len(sys.argv) == 2: 
-    d = cPickle.load(open(sys.argv[1]))
-    print 'Team names:', d.keys()
-  sys.exit(2)
-
-d = cPickle.load(open(sys.argv[1]))
-user = sys.argv[2]
-k = 0
-print 'Unpacking games for', user
-for g, w in d[user]['gameHistory']:
-    k += 1
-    t = {'layout': g.state.data.layout, 'agents': g.agents, 'actions': g.moveHistory, 'length': g.length}
-    fname = 'replay_' + user + '_' + str(k)
-    print 'Game:', fname
-    cPickle.dump(t,file(fname, 'w'))
\ No newline at end of file
+"""
+Unpacks the stats file of a server, a pickle of {user: {'gameHistory':
+[(game, won), ...]}}, into replay files (see replay.py) named
+replay_<user>_<k>.
+
+The stats file holds every game with its agents and states, and loading it
+whole takes gigabytes. It is instead read by a pickle.Unpickler that builds
+only the parts of the games needed for replays: the classes of the agents
+(and of anything not from the game modules) are replaced by empty stand-ins,
+and every game is handed on as soon as it is read, after which what was built
+for it is dropped. The games that pass the filters are written to replay files
+by a pool of worker processes while the file is read.
+
+Files with several pickles one after the other are read to the end.
+
+USAGE: python unpack.py [-u USERS] [-l LAYOUTS] [-o DIRECTORY] [-w WORKERS] stats_file
+       python unpack.py --list stats_file
+"""
+
+import os
+import sys
+import glob
+import types
+import pickle
+import copy_reg
+import collections
+
+# The modules whose classes are built as they are; those of any other
+# module, such as the agents of the teams, are replaced by Discarded
+GAME_MODULES = ('game', 'capture', 'layout', 'util', '__builtin__', 'copy_reg')
+
+class Discarded:
+  "An empty stand-in for an object of the stats file that is not needed"
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def __setstate__(self, state):
+    pass
+
+  def __call__(self, *args, **kwargs):
+    return Discarded()
+
+def reconstruct(cls, base, state):
+  "copy_reg._reconstructor, for the stand-ins as well"
+  if isinstance(cls, type):
+    return copy_reg._reconstructor(cls, base, state)
+  return Discarded()
+
+class PrunedMemo(dict):
+  """
+  The memo of the unpickler. The objects built for a game are removed once
+  it has been handed on, except strings and the classes and functions that
+  were looked up, which later games may share. The first layout of every
+  layout text is kept as well, with its walls, and stands in for the other
+  layouts of that text (and their walls), since any of them may be shared.
+  A game that refers to any other removed object gets a stand-in instead.
+  """
+  def __init__(self):
+    dict.__init__(self)
+    self.recent = []
+    self.missing = 0
+    self.layouts = {}
+
+  def __setitem__(self, key, value):
+    dict.__setitem__(self, key, value)
+    self.recent.append(key)
+
+  def __missing__(self, key):
+    self.missing += 1
+    return Discarded()
+
+  def prune(self):
+    import layout
+    shared = (basestring, type, types.ClassType, types.FunctionType)
+    recent = [key for key in self.recent if key in self]
+
+    # The kept layout of each layout of the game, and its walls
+    kept = {}
+    for key in recent:
+      value = self[key]
+      if isinstance(value, layout.Layout) and hasattr(value, 'layoutText'):
+        first = self.layouts.setdefault(tuple(value.layoutText), value)
+        kept[id(value)] = first
+        kept[id(value.walls)] = first.walls
+
+    for key in recent:
+      value = self[key]
+      if isinstance(value, shared):
+        continue
+      if id(value) in kept:
+        dict.__setitem__(self, key, kept[id(value)])
+      else:
+        del self[key]
+    self.recent = []
+
+class StatsUnpickler(pickle.Unpickler):
+  """
+  Reads a stats file and calls handle(user, game) for every game, as it is
+  read, where game is a dict of its layout, number of agents, moves, length
+  and score. The games themselves are not kept.
+  """
+  dispatch = dict(pickle.Unpickler.dispatch)
+
+  def __init__(self, stream, handle):
+    pickle.Unpickler.__init__(self, stream)
+    self.memo = PrunedMemo()
+    self.handle = handle
+
+  def find_class(self, module, name):
+    if (module, name) == ('copy_reg', '_reconstructor'):
+      return reconstruct
+    if module.split('.')[0] not in GAME_MODULES:
+      return Discarded
+    return pickle.Unpickler.find_class(self, module, name)
+
+  def getUser(self):
+    """
+    The user whose games are being read: the key on the stack before the
+    dict whose 'gameHistory' is being read (with a mark between them if its
+    items are set together)
+    """
+    stack = self.stack
+    for j in range(2, len(stack)):
+      if isinstance(stack[j], basestring) and stack[j] == 'gameHistory':
+        i = j - 1
+        if stack[i] is self.mark:
+          i -= 1
+        if isinstance(stack[i - 1], basestring):
+          return stack[i - 1]
+    return None
+
+  def load_build(self):
+    import game
+    pickle.Unpickler.load_build(self)
+    g = self.stack[-1]
+    if isinstance(g, game.Game):
+      self.stack[-1] = None
+      self.handle(self.getUser(), getGameRecord(g))
+      self.memo.prune()
+  dispatch[pickle.BUILD] = load_build
+
+  def loadAll(self):
+    "Reads every pickle of the stream, keeping none of them"
+    while True:
+      try:
+        self.load()
+      except EOFError:
+        return
+      self.stack = []
+      self.memo = PrunedMemo()
+
+def getGameRecord(g):
+  "What is needed to replay a game of the stats file"
+  gameLayout = g.state.data.layout
+  return {'layout': gameLayout.layoutText, 'name': getattr(gameLayout, 'name', None),
+          'numAgents': len(g.state.data.agentStates), 'actions': list(g.moveHistory),
+          'length': g.length, 'score': g.state.data.score}
+
+def getLayoutNames(directory='layouts'):
+  "The names of the layouts in directory, by their text, for older games without one"
+  names = {}
+  for path in glob.glob(os.path.join(directory, '*.lay')):
+    lines = [line.strip() for line in open(path)]
+    names['\n'.join(line for line in lines if line)] = os.path.basename(path)[:-len('.lay')]
+  return names
+
+def writeReplay(task):
+  "Writes a game of the stats file to a replay file. Returns (path, error)"
+  import layout, replay
+  path, user, k, record = task
+  try:
+    score = record['score']
+    replay.writeGame(path, layout.Layout(record['layout'], record['name']),
+                     record['numAgents'], record['actions'], record['length'],
+                     result={'score': score, 'winner': 'Red' if score > 0 else
+                             'Blue' if score < 0 else 'Tie'},
+                     info={'user': user, 'game': k})
+    return path, None
+  except Exception, e:
+    return path, '%s: %s' % (type(e).__name__, e)
+
+class Unpacker:
+  """
+  Writes the games of the users (all if None) on the layouts (all if None)
+  to replay files in directory, using numWorkers processes. At most a few
+  games per worker are waiting to be written at any time.
+  """
+  def __init__(self, directory='.', users=None, layouts=None, numWorkers=1):
+    self.directory = directory
+    self.users = users and set(users)
+    self.layouts = layouts and set(layouts)
+    self.layoutNames = getLayoutNames()
+    self.counts = collections.defaultdict(int)
+    self.written, self.failed, self.skipped = 0, 0, 0
+    self.pending = collections.deque()
+    self.pool = None
+    if numWorkers > 1:
+      import multiprocessing
+      self.pool = multiprocessing.Pool(numWorkers)
+    self.maxPending = 4 * numWorkers
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def handle(self, user, record):
+    if user is not None:
+      self.counts[user] += 1
+    if record['name'] is None:
+      record['name'] = self.layoutNames.get('\n'.join(record['layout']))
+    if ((self.users is not None and user not in self.users) or
+        (self.layouts is not None and record['name'] not in self.layouts)):
+      self.skipped += 1
+      return
+    k = self.counts[user]
+    path = os.path.join(self.directory, 'replay_%s_%d' % (user, k))
+    task = (path, user, k, record)
+    if self.pool is None:
+      self.done(writeReplay(task))
+      return
+    self.pending.append(self.pool.apply_async(writeReplay, (task,)))
+    while len(self.pending) > self.maxPending or (self.pending and self.pending[0].ready()):
+      self.done(self.pending.popleft().get())
+
+  def done(self, (path, error)):
+    if error is None:
+      print 'Game:', path
+      self.written += 1
+    else:
+      print 'Could not write %s (%s)' % (path, error)
+      self.failed += 1
+
+  def unpack(self, path):
+    stream = open(path, 'rb')
+    try:
+      StatsUnpickler(stream, self.handle).loadAll()
+      while self.pending:
+        self.done(self.pending.popleft().get())
+    finally:
+      stream.close()
+      if self.pool is not None:
+        self.pool.terminate()
+    print 'Wrote %d games (%d failed, %d filtered out) to %s' % (self.written,
+        self.failed, self.skipped, self.directory)
+
+def listUsers(path):
+  "Prints the users of a stats file and their numbers of games"
+  counts = collections.Counter()
+  stream = open(path, 'rb')
+  StatsUnpickler(stream, lambda user, record: counts.update([user])).loadAll()
+  stream.close()
+  for user, count in sorted(counts.items()):
+    print '%-30s %d games' % (user, count)
+
+def readCommand(argv):
+  "Processes the command line"
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('-u', '--users', default=None,
+                    help='Comma separated users to unpack [Default: all]')
+  parser.add_option('-l', '--layouts', default=None,
+                    help='Comma separated layouts to unpack [Default: all]')
+  parser.add_option('-o', '--output', default='.',
+                    help='The directory of the replay files [Default: %default]')
+  parser.add_option('-w', '--workers', type='int', default=0,
+                    help='Number of worker processes [Default: one per CPU]')
+  parser.add_option('--list', action='store_true', default=False,
+                    help='List the users and their numbers of games')
+  options, args = parser.parse_args(argv)
+  # The old usage: unpack.py stats_file team_name
+  if len(args) == 2 and not options.users:
+    options.users = args.pop()
+  if len(args) != 1:
+    parser.error('Give the stats file to unpack')
+  if not options.workers:
+    import multiprocessing
+    options.workers = multiprocessing.cpu_count()
+  return options, args[0]
+
+if __name__ == '__main__':
+  options, path = readCommand(sys.argv[1:])
+  if options.list:
+    listUsers(path)
+  else:
+    split = lambda s: s and s.split(',')
+    Unpacker(options.output, split(options.users), split(options.layouts),
+             options.workers).unpack(path)
@@ -340,6 +340,135 @@ def normalize(vectorOrCounter):
     if s == 0: return vector
     return [el / s for el in vector]
                 
+class Sampler:
+  """
+  Draws repeatedly from a fixed discrete distribution. The tables are built
+  once in O(n) from a Counter (or a list of probabilities and their values,
+  which are the indices of the list if not given), after which sample() is
+  O(1) using Vose's alias method and sampleN(k) and systematic(k) are O(k)
+  and O(n + k).
+
+  >>> s = Sampler(Counter({'a': 1, 'b': 3}), rng=random.Random(0))
+  >>> len(s.systematic(8)), s.systematic(8).count('b')
+  (8, 6)
+  >>> Sampler([0.0, 1.0]).sample()
+  1
+
+  The rng is anything with a random() method, so a seeded random.Random can
+  be passed in to make the draws reproducible.
+  """
+  def __init__(self, distribution, values=None, rng=random):
+    if isinstance(distribution, dict):
+      items = distribution.items()
+      distribution = [i[1] for i in items]
+      values = [i[0] for i in items]
+    total = float(sum(distribution))
+    if len(distribution) == 0 or total <= 0:
+      raise ValueError('Cannot sample from an empty distribution')
+    if values is None:
+      values = range(len(distribution))
+    elif len(values) != len(distribution):
+      raise ValueError('A distribution of %d probabilities needs as many values, not %d'
+                       % (len(distribution), len(values)))
+    self.values = values
+    self.rng = rng
+    n = len(distribution)
+
+    # Cumulative distribution, used for systematic resampling
+    self.cdf, acc = [], 0.0
+    for p in distribution:
+      acc += p / total
+      self.cdf.append(acc)
+
+    # Alias table, used for independent draws
+    scaled = [p * n / total for p in distribution]
+    self.prob, self.alias = [1.0] * n, range(n)
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+      s, l = small.pop(), large.pop()
+      self.prob[s], self.alias[s] = scaled[s], l
+      scaled[l] += scaled[s] - 1.0
+      if scaled[l] < 1.0: small.append(l)
+      else: large.append(l)
+    # Whatever is left over only differs from 1 by rounding error
+
+  def sample(self):
+    "Returns a single independent draw"
+    i = int(self.rng.random() * len(self.prob))
+    if self.rng.random() < self.prob[i]:
+      return self.values[i]
+    return self.values[self.alias[i]]
+
+  def sampleN(self, k):
+    "Returns k independent draws"
+    return [self.sample() for _ in xrange(k)]
+
+  def systematic(self, k):
+    """
+    Returns k draws using systematic (low-variance) resampling: a single
+    uniform offset, then k evenly spaced points walked along the cdf. Every
+    value with weight w is drawn either floor(w*k) or ceil(w*k) times.
+    """
+    samples = []
+    step = 1.0 / k
+    u = self.rng.random() * step
+    i, last = 0, len(self.cdf) - 1
+    for _ in xrange(k):
+      while u > self.cdf[i] and i < last:
+        i += 1
+      samples.append(self.values[i])
+      u += step
+    return samples
+
+def deriveSeed(seed, *keys):
+  """
+  A seed for the part of a run named by keys (such as the index of a game),
+  derived from seed. It does not depend on the process or the run, so any
+  part of a run can be reproduced on its own.
+
+  >>> deriveSeed(1, 0) == deriveSeed(1, 0), deriveSeed(1, 0) == deriveSeed(1, 1)
+  (True, False)
+  """
+  import hashlib
+  return int(hashlib.md5(repr((seed,) + keys)).hexdigest()[:8], 16)
+
+class RandomStreams:
+  """
+  Separate streams of the random module for the engine of a game and for
+  each team, all derived from one seed. The agents and the engine call the
+  random module directly, so a stream is the state of the module's generator:
+  switching saves the state of the current stream and restores the other.
+  Then the draws of a team do not depend on how many numbers the other team
+  or the engine drew, and the other way around.
+
+  The names of the streams of the agents are given by index in agentStreams.
+  Creating the streams makes the engine's the current one.
+  """
+  def __init__(self, seed, agentStreams):
+    self.seed = seed
+    self.agentStreams = agentStreams
+    self.states = {}
+    for name in ['engine'] + sorted(set(agentStreams)):
+      random.seed(deriveSeed(seed, name))
+      self.states[name] = random.getstate()
+    self.current = 'engine'
+    random.setstate(self.states['engine'])
+
+  def switch(self, name):
+    if name != self.current:
+      self.states[self.current] = random.getstate()
+      random.setstate(self.states[name])
+      self.current = name
+
+  def enterAgent(self, agentIndex):
+    "Switches to the stream of an agent, before calling it"
+    self.switch(self.agentStreams[agentIndex])
+
+  def leaveAgent(self):
+    "Switches back to the stream of the engine"
+    self.switch('engine')
+
 def nSample(distribution, values, n):
   if sum(distribution) != 1:
     distribution = normalize(distribution)
@@ -348,7 +477,8 @@ def nSample(distribution, values, n):
   samples = []
   samplePos, distPos, cdf = 0,0, distribution[0]
   while samplePos < n:
-    if rand[samplePos] < cdf:
+    # The last value absorbs any floating-point shortfall in the cdf
+    if rand[samplePos] < cdf or distPos == len(distribution) - 1:
       samplePos += 1
       samples.append(values[distPos])
     else: